@@ -269,6 +269,8 @@ class parsers:
         args.jobs(group, hidden=True)
         args.build_jobs(group, hidden=True)
         args.run_jobs(group, hidden=True)
+        args.run_cpus(group, hidden=True)
+        args.build_cpus(group, hidden=True)
         args.size_cmd(group, hidden=True)
         args.time_cmd(group, hidden=True)
         args.force(group, hidden=True)
@@ -1340,6 +1342,9 @@ class parsers:
         sub = subs.add_parser(
             "add_result", help="Add result to database")
         parsers.atos_lib_addresult(sub)
+        sub = subs.add_parser(
+            "compact", help="Compact or convert database")
+        parsers.atos_lib_compact(sub)
         sub = subs.add_parser(
             "config", help="Compiler configuration")
         parsers.atos_lib_config(sub)
@@ -1394,6 +1399,7 @@ class parsers:
         args.configuration_path(parser)
         args.query(parser)
         args.atos_lib.text(parser)
+        args.atos_lib.lines(parser)
         return parser
 
     @staticmethod
@@ -1425,6 +1431,9 @@ class parsers:
         args.query(parser)
         args.atos_lib.replacement(parser)
         args.force(parser)
+        args.atos_lib.lines(parser)
+        args.atos_lib.since(parser)
+        args.atos_lib.duplicates(parser)
         return parser
 
     @staticmethod
@@ -1438,6 +1447,8 @@ class parsers:
         args.query(parser)
         args.atos_lib.replacement(parser)
         args.force(parser)
+        args.atos_lib.since(parser)
+        args.atos_lib.duplicates(parser)
         return parser
 
     @staticmethod
@@ -1465,6 +1476,20 @@ class parsers:
         args.atos_lib.result(parser)
         return parser
 
+    @staticmethod
+    def atos_lib_compact(parser=None):
+        """ atos lib compact arguments parser factory. """
+        if parser == None:  # pragma: uncovered
+            parser = ATOSArgumentParser(prog="atos-lib-compact",
+                                        description="ATOS lib tool")
+        args.configuration_path(parser)
+        args.atos_lib.type(
+            parser, default=None,
+            help_msg="converted database type (default: unchanged)")
+        args.atos_lib.aggregate(parser)
+        args.atos_lib.failures(parser)
+        return parser
+
     @staticmethod
     def atos_lib_config(parser=None):
         """ atos lib config arguments parser factory. """
@@ -1991,6 +2016,28 @@ class args:
              type=int,
              help=help_msg)
 
+    @staticmethod
+    def run_cpus(parser, args=("--run-cpus",), hidden=False):
+        help_msg = parsers.help_message(
+            "dedicated cpus of the parallel run jobs, 'auto' or cpu lists"
+            " separated by ':' (for instance 2-3:4-5)",
+            hidden)
+        parser.add_argument(
+            *args,
+             dest="run_cpus",
+             help=help_msg)
+
+    @staticmethod
+    def build_cpus(parser, args=("--build-cpus",), hidden=False):
+        help_msg = parsers.help_message(
+            "cpu list of the parallel build jobs, default to the cpus"
+            " not dedicated to runs",
+            hidden)
+        parser.add_argument(
+            *args,
+             dest="build_cpus",
+             help=help_msg)
+
     @staticmethod
     def remote_exec_script(
         parser, args=("--remote-exec-script",), hidden=False):
@@ -2131,13 +2178,34 @@ class args:
         """ Namespace for non common atos lib arguments. """
 
         @staticmethod
-        def type(parser, args=("-t", "--type")):
+        def type(parser, args=("-t", "--type"), default='results_db',
+                 help_msg="database type"):
             parser.add_argument(
                 *args,
                  dest="type",
-                 choices=['results_db', 'json', 'pickle'],
-                 help="database type",
-                 default='results_db')
+                 choices=['results_db', 'json', 'pickle', 'sqlite',
+                          'binary'],
+                 help=help_msg,
+                 default=default)
+
+        @staticmethod
+        def aggregate(parser, args=("--aggregate",)):
+            parser.add_argument(
+                *args,
+                 dest="aggregate",
+                 help="fold the runs of a variant in one result keeping"
+                 " the time of each run",
+                 action="store_true")
+
+        @staticmethod
+        def failures(parser, args=("--failures",)):
+            parser.add_argument(
+                *args,
+                 dest="failures",
+                 choices=['keep', 'drop', 'archive'],
+                 help="failed results handling, archived failures are"
+                 " moved to results.failures.json (default: keep)",
+                 default='keep')
 
         @staticmethod
         def shared(parser, args=("--shared",)):
@@ -2156,6 +2224,33 @@ class args:
                  help="text output format (default: json)",
                  action="store_true")
 
+        @staticmethod
+        def lines(parser, args=("--lines",)):
+            parser.add_argument(
+                *args,
+                 dest="lines",
+                 help="output results as JSON lines, one result per line",
+                 action="store_true")
+
+        @staticmethod
+        def since(parser, args=("--since",)):
+            parser.add_argument(
+                *args,
+                 dest="since",
+                 help="skip the source results up to the watermark SINCE"
+                 " of a previous push/pull, which fails if these results"
+                 " changed since (compacted database, other query)",
+                 default='0')
+
+        @staticmethod
+        def duplicates(parser, args=("--duplicates",)):
+            parser.add_argument(
+                *args,
+                 dest="duplicates",
+                 help="also transfer results already in the destination"
+                 " database",
+                 action="store_true")
+
         @staticmethod
         def groupname(parser, args=("-g", "--group_name")):
             parser.add_argument(
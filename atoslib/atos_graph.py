@@ -335,9 +335,36 @@ def point_str(point, short=False, no_id=False):
     return res
 
 
+# live frontiers for --follow mode: {dbpath: (frontier, {variant: result})}
+live_frontiers = {}
+
+
+def update_live_frontier(dbpath, variant_results):
+    # insert new variants into the live frontier of dbpath, rebuild it
+    # only if results of already known variants have changed
+    frontier, known = live_frontiers.get(dbpath, (None, {}))
+    current = dict(map(lambda x: (x.variant, x), variant_results))
+    if frontier is None or any(map(lambda x: (
+                x not in current or
+                (current[x].size, current[x].time) != (
+                    known[x].size, known[x].time)), known)):
+        frontier, known = atos_lib.results_frontier(), {}
+        live_frontiers[dbpath] = (frontier, known)
+    for result in variant_results:
+        if result.variant not in known:
+            known[result.variant] = result
+            frontier.insert(result)
+    # once all inserted, as new variants may dominate known ones
+    for result in variant_results:
+        result.on_frontier = known[result.variant].on_frontier
+
+
 def getoptcases(dbpath, opts):
     variant_results = atos_lib.get_results(dbpath, opts)
-    atos_lib.atos_client_results.set_frontier_field(variant_results)
+    if opts.follow:
+        update_live_frontier(dbpath, variant_results)
+    else:
+        atos_lib.atos_client_results.set_frontier_field(variant_results)
     frontier = filter(lambda x: x.on_frontier, variant_results)
     if not opts.follow: print '%d points, %d on frontier' % (
         len(variant_results), len(frontier))
@@ -486,7 +513,7 @@ def correlgraph(opts):
     targets = opts.targets and opts.targets.split('+') or None
     for dbpath in dbpathes:
         client = atos_lib.atos_client_results(
-            atos_lib.atos_db.db(dbpath, no_cache=True),
+            atos_lib.atos_db.db(dbpath),
             targets and targets.split(',') or None,
             atos_lib.strtoquery(opts.query), opts.id)
         client.compute_speedups(opts.refid)
@@ -557,11 +584,21 @@ def heatgraph(opts):
     tradeoff = opts.tradeoffs and opts.tradeoffs[0]
 
     gen_values = sorted(cookie_to_gen.values())[1:]
-    for gen in gen_values:
-        gen_results = filter(
-            lambda res: gen_number(res, cookie_to_gen) == gen, optcases)
-        gen_points = map(cfg_result, gen_results)
-        all_points.append(gen_points)
+    if atos_lib.results_columns.enabled(optcases):
+        columns = atos_lib.results_columns(optcases)
+        points = columns.speedup
+        if opts.tradeoffs:
+            points = (
+                points + (columns.sizered / opts.tradeoffs[0])) * 100.0
+        gens = columns.cookie_groups(cookie_to_gen)
+        for gen in gen_values:
+            all_points.append(points[gens == gen].tolist())
+    else:
+        for gen in gen_values:
+            gen_results = filter(
+                lambda res: gen_number(res, cookie_to_gen) == gen, optcases)
+            gen_points = map(cfg_result, gen_results)
+            all_points.append(gen_points)
     print "gensz", map(lambda x: len(x), all_points)
 
     # add missing points and sort each generation results
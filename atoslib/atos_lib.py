@@ -21,10 +21,18 @@
 #
 
 import sys, os, re, math, itertools, time, json, hashlib, signal
+import bisect
+import collections
 import cPickle as pickle
+import sqlite3
+import struct
+import fcntl
+import errno
+import mmap
 import tempfile
 import glob
 import threading
+import multiprocessing
 import atexit
 import functools
 
@@ -35,6 +43,11 @@ import logger
 import arguments
 import cc_arguments
 
+try:
+    import numpy
+except ImportError:  # pragma: uncovered
+    numpy = None
+
 # ####################################################################
 
 
@@ -47,7 +60,12 @@ class atos_db():
     required_fields = ['target', 'variant', 'size', 'time']
 
     # used for locking database before r/w accesses in multithreaded mode
-    lock = threading.Lock()
+    # (reentrant, held by compact_db around database accesses)
+    lock = threading.RLock()
+
+    # {configuration path: results.lock descriptor}, shared lock held by
+    # processes which opened the database, exclusive one by conversions
+    db_locks = {}
 
     def __init__(self): raise NotImplementedError
 
@@ -64,12 +82,38 @@ class atos_db():
     #   ex: get('$[?(@.target="x" && @.variant="REF")]'
     def get_results(self, query=None): raise NotImplementedError
 
+    # return list of records having at least one of the given cookies
+    #   ex: get_cookies_results(['a58f2...', 'c4e01...'])
+    def get_cookies_results(self, cookies):
+        return results_filter_cookies(self.get_results(), cookies)
+
+    # return an iterator on result records matching query
+    def iter_results(self, query=None):
+        return iter(list(self.get_results(query)))
+
+    # return merged results (see merge_results) of records matching query
+    def get_merged_results(self, query=None, merge_targets=True):
+        return merge_results(self.get_results(query), merge_targets)
+
+    # return merged results of records having one of the given cookies
+    def get_merged_cookies_results(self, cookies):
+        return merge_results(self.get_cookies_results(cookies))
+
+    # read records added by other processes since last read
+    def refresh(self): pass
+
     #
     @staticmethod
-    def db(results_path, no_cache=False):
+    def db(results_path):
 
         if os.path.isdir(results_path):  # pragma: branch_uncovered
             atos_configuration = results_path
+            # database not converted by other processes while cached
+            atos_db._lock_shared(atos_configuration)
+            # results.sqlite: indexed queries, no full load
+            db_sqlt = os.path.join(atos_configuration, 'results.sqlite')
+            # results.bin: mmap'ed, rows decoded on demand
+            db_bin = os.path.join(atos_configuration, 'results.bin')
             # results.pkl  loadtime:  3.50s  filesize: 229M
             db_pckl = os.path.join(atos_configuration, 'results.pkl')
             # results.json loadtime: 27.63s  filesize: 217M
@@ -78,7 +122,11 @@ class atos_db():
             db_dflt = os.path.join(atos_configuration, 'results.db')
 
             # select db file in atos-config directory
-            if os.path.exists(db_pckl):
+            if os.path.exists(db_sqlt):
+                db_func, db_file = atos_db_sqlite, db_sqlt
+            elif os.path.exists(db_bin):
+                db_func, db_file = atos_db_binary, db_bin
+            elif os.path.exists(db_pckl):
                 db_func, db_file = atos_db_pickle, db_pckl
             elif os.path.exists(db_json):
                 db_func, db_file = atos_db_json, db_json
@@ -86,8 +134,12 @@ class atos_db():
                 db_func, db_file = atos_db_file, db_dflt
 
         elif os.path.isfile(results_path):  # pragma: uncovered
-            ext = os.path.splitext(results_path)
-            if ext == ".pkl":
+            ext = os.path.splitext(results_path)[1]
+            if ext == ".sqlite":
+                db_func, db_file = atos_db_sqlite, results_path
+            elif ext == ".bin":
+                db_func, db_file = atos_db_binary, results_path
+            elif ext == ".pkl":
                 db_func, db_file = atos_db_pickle, results_path
             elif ext == ".json":
                 db_func, db_file = atos_db_json, results_path
@@ -102,47 +154,361 @@ class atos_db():
         if not getattr(atos_db, 'db_cache', None):
             atos_db.db_cache = {}
 
-        # use already-opened db if any
+        # use already-opened db if any, after reading the results
+        # added by other processes since the last access
         db_file = os.path.abspath(db_file)
-        if not no_cache and db_file in atos_db.db_cache.keys():
-            return atos_db.db_cache[db_file]
+        if db_file in atos_db.db_cache:
+            cached_db = atos_db.db_cache[db_file]
+            cached_db.refresh()
+            return cached_db
         else:
             new_db = db_func(db_file)
             atos_db.db_cache[db_file] = new_db
             return new_db
 
+    @staticmethod
+    def _lock_shared(configuration_path):
+        # shared lock on results.lock, kept until the process exits
+        configuration_path = os.path.abspath(configuration_path)
+        with atos_db.lock:
+            if configuration_path in atos_db.db_locks: return
+            if process._dryrun: return  # pragma: uncovered
+            try:
+                lock_fd = os.open(
+                    os.path.join(configuration_path, 'results.lock'),
+                    os.O_RDONLY | os.O_CREAT | process._O_CLOEXEC, 0666)
+            except OSError:  # pragma: uncovered
+                # read-only shared database: no conversion possible
+                return
+            fcntl.flock(lock_fd, fcntl.LOCK_SH)
+            atos_db.db_locks[configuration_path] = lock_fd
+
+
+# ####################################################################
+
+
+class atos_db_writer():
+    """
+    Write-behind queue of results, used in parallel mode. Results
+    queued from any thread are written by a single background thread
+    that groups them by database, with one add_results call (thus one
+    locked write) per database every flush interval.
+    flush() is a barrier returning once all results queued before the
+    call are written, it also wakes up the writer without waiting for
+    the end of the interval.
+    """
+
+    # seconds during which queued results are grouped
+    interval = 0.2
+
+    # process-wide writer, created on first use
+    writer = None
+    writer_lock = threading.Lock()
+
+    @staticmethod
+    def queue_results(db, entries):
+        with atos_db_writer.writer_lock:
+            if not atos_db_writer.writer:
+                atos_db_writer.writer = atos_db_writer()
+        atos_db_writer.writer.add_results(db, entries)
+
+    @staticmethod
+    @atexit.register
+    def flush_results():
+        if atos_db_writer.writer: atos_db_writer.writer.flush()
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        # [(db, entries)] not yet written
+        self.queue = []
+        # number of add_results calls queued, written and to be flushed
+        self.queued, self.written, self.flushed = 0, 0, 0
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add_results(self, db, entries):
+        with self.cond:
+            self.queue.append((db, entries))
+            self.queued += 1
+            self.cond.notify_all()
+
+    def flush(self):
+        with self.cond:
+            flushed = self.flushed = self.queued
+            self.cond.notify_all()
+            while self.written < flushed:
+                # waiting with a timeout can be interrupted (Ctrl-C)
+                self.cond.wait(1.0)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                # let other threads queue their results
+                deadline = time.time() + atos_db_writer.interval
+                while self.flushed <= self.written and (
+                    time.time() < deadline):
+                    self.cond.wait(max(0, deadline - time.time()))
+                queue, self.queue = self.queue, []
+            # {db: [entry]}, in queueing order
+            dbs, db_entries = [], {}
+            for (db, entries) in queue:
+                if db not in db_entries:
+                    dbs.append(db)
+                    db_entries[db] = []
+                db_entries[db].extend(entries)
+            for db in dbs:
+                try:
+                    db.add_results(db_entries[db])
+                except:  # pragma: uncovered (error)
+                    logger.internal_error(
+                        'failed to write results: %s' % sys.exc_info()[1],
+                        exit_status=0)
+            with self.cond:
+                self.written += len(queue)
+                self.cond.notify_all()
+
+
+# ####################################################################
+
+
+class results_index():
+    """
+    List of results with dictionary indexes on some of their keys.
+    Dict queries with literal values on indexed keys are answered from
+    the indexes, regexp values are only matched against the distinct
+    values of the index, other keys are filtered on the selected results.
+    Also maintains the running sum of execution times of successful runs
+    of each (variant, target), used to compute merged results.
+    """
+
+    keys = ['target', 'variant', 'hash']
+
+    # characters that make a query value a regexp
+    regexp_chars = set('.^$*+?{}[]\\|()')
+
+    def __init__(self, results=None):
+        self.results = []
+        # {key: {value: [result position]}}
+        self.indexes = dict((key, {}) for key in results_index.keys)
+        # {cookie: [result position]}
+        self.cookies = {}
+        # {(variant, target): [time sum, [successful result position]]}
+        self.aggregates = {}
+        self.failures = set()
+        # {result position: result object}, built on demand
+        self.objects = {}
+        self.extend(results or [])
+
+    def extend(self, results):
+        for result in expand_results(results):
+            position = len(self.results)
+            self.results.append(result)
+            for key in results_index.keys:
+                self.indexes[key].setdefault(
+                    result.get(key, ''), []).append(position)
+            for cookie in set(result.get('cookies', '').split(',')):
+                self.cookies.setdefault(cookie, []).append(position)
+            if 'FAILURE' in result.values():
+                self.failures.add(position)
+                continue
+            aggregate = self.aggregates.setdefault(
+                (result['variant'], result['target']), [0, []])
+            # times may be given as strings, as in merge_results
+            aggregate[0] += float(result['time'])
+            aggregate[1].append(position)
+
+    def query(self, query):
+        if not query or isinstance(query, str):
+            return results_filter(self.results, query)
+        return [self.results[p] for p in self.positions(query)]
+
+    def cookies_query(self, cookies):
+        if not cookies: return self.results  # pragma: uncovered
+        return [self.results[p] for p in self.cookies_positions(cookies)]
+
+    def merged_query(self, query, merge_targets=True):
+        if isinstance(query, str):  # pragma: uncovered
+            return merge_results(self.query(query), merge_targets)
+        positions = (self.positions(query) if query
+                     else xrange(len(self.results)))
+        return self.merged_results(positions, merge_targets)
+
+    def merged_cookies_query(self, cookies):
+        if not cookies:  # pragma: uncovered
+            return self.merged_query(None)
+        return self.merged_results(self.cookies_positions(cookies))
+
+    def positions(self, query):
+        """ Sorted positions of the results matching the dict query. """
+        positions, remaining = None, {}
+        for (key, value) in query.items():
+            if key not in results_index.keys:
+                remaining[key] = value
+                continue
+            # same value conversion as results_filter
+            value, index = '%s' % value, self.indexes[key]
+            if value == '.*': continue
+            if results_index.is_literal(value):
+                matching = set(index.get(value, []))
+            else:
+                matching, match = set(), re.compile('^%s$' % value).match
+                for indexed in index.keys():
+                    if match(indexed): matching.update(index[indexed])
+            positions = matching if positions is None else (
+                positions & matching)
+            if not positions: return []
+        positions = (xrange(len(self.results)) if positions is None
+                     else sorted(positions))
+        if not remaining: return list(positions)
+        match = results_query(remaining)
+        return [p for p in positions if match(self.results[p])]
+
+    def cookies_positions(self, cookies):
+        """ Sorted positions of the results having one of the cookies. """
+        positions = set()
+        for cookie in cookies:
+            positions.update(self.cookies.get(cookie, []))
+        return sorted(positions)
+
+    def merged_results(self, positions, merge_targets=True):
+        """
+        Same as merge_results() on the results at given positions.
+        Result objects are built once per result, and the runs of a
+        (variant, target) are averaged using the running time sum when
+        they are all selected.
+        """
+        variants, targets, runs = [], {}, {}
+        for position in positions:
+            if position in self.failures: continue
+            result = self.results[position]
+            variant, target = result['variant'], result['target']
+            if variant not in targets:
+                variants.append(variant)
+                targets[variant] = []
+            if (variant, target) not in runs:
+                targets[variant].append(target)
+                runs[(variant, target)] = []
+            runs[(variant, target)].append(position)
+        variant_results = []
+        for variant in variants:
+            targets_results = map(
+                lambda target: self._merged_runs(
+                    (variant, target), runs[(variant, target)]),
+                targets[variant])
+            if merge_targets:
+                targets_results = [
+                    atos_client_results.result.merge_targets(
+                        '-'.join(targets[variant]), targets_results)]
+            variant_results.extend(targets_results)
+        return variant_results or None
+
+    def _merged_runs(self, key, positions):
+        missing = filter(lambda x: x not in self.objects, positions)
+        self.objects.update(zip(missing, atos_client_results.result.records(
+                    map(lambda x: self.results[x], missing))))
+        runs = [self.objects[p] for p in positions]
+        time_sum, all_positions = self.aggregates[key]
+        if len(positions) != len(all_positions):
+            time_sum = sum(map(lambda x: float(x.time), runs))
+        merged = runs[0].copy()
+        merged.time = time_sum / len(runs)
+        merged._results = runs
+        return merged
+
+    @staticmethod
+    def is_literal(value):
+        return not results_index.regexp_chars.intersection(value)
+
 
 # ####################################################################
 
 
 class atos_db_file(atos_db):
+    """
+    Text database, one 'ATOS: target: variant: key: value' line per
+    result field. Large files are parsed in parallel by chunks ending
+    at record ends, and the parsed results are saved in a cache file
+    with the parsed size: as the file is append-only until replaced
+    by a compaction, the cache is reused while the file inode is
+    unchanged and only the records appended since are parsed.
+    """
+
+    # minimal size for parallel parsing and parsed results cache
+    parallel_min_size = 32 << 20
+
+    # minimal size of the chunks parsed in parallel
+    chunk_min_size = 4 << 20
 
     def __init__(self, db_file):
         self.db_file = db_file
-        self.results = []
+        self.cache_file = db_file + '.cache'
+        self.index = results_index()
+        # (device, inode) and size of the file at last parse
+        self.db_inode, self.db_offset = None, 0
         self._create()
-        self._read_results()
+        self.refresh()
 
     def get_results(self, query=None):
         with atos_db.lock:
-            return results_filter(self.results, query)
+            return self.index.query(query)
 
-    def add_results(self, entries):
+    def get_cookies_results(self, cookies):
         with atos_db.lock:
-            self.results.extend(entries)
-            self._write_entries(entries)
+            return self.index.cookies_query(cookies)
 
-    def _write_entries(self, entries):
-        entries_str = ''.join(
-            atos_db_file.entry_str(entry) for entry in entries)
-        with process.open_locked(self.db_file, 'a') as db_file:
-            db_file.write(entries_str)
+    def get_merged_results(self, query=None, merge_targets=True):
+        with atos_db.lock:
+            return self.index.merged_query(query, merge_targets)
+
+    def get_merged_cookies_results(self, cookies):
+        with atos_db.lock:
+            return self.index.merged_cookies_query(cookies)
+
+    def add_results(self, entries):
+        with atos_db.lock:
+            entries_str = ''.join(
+                atos_db_file.entry_str(entry) for entry in entries)
+            with process.open_locked(self.db_file, 'a') as db_file:
+                # get results of other processes before adding ours
+                self._read_results()
+                db_file.write(entries_str)
+                db_file.flush()
+                db_end = db_file.tell()
+            if process._dryrun:  # pragma: uncovered
+                self.index.extend(entries)
+            elif self.db_offset + len(entries_str) == db_end:
+                self.index.extend(entries)
+                self.db_offset = db_end
+            else:  # pragma: uncovered
+                # pending incomplete record, parse back new entries
+                self._read_results()
+
+    def refresh(self):
+        with atos_db.lock:
+            if not os.path.exists(self.db_file): return  # pragma: uncovered
+            db_stat = os.stat(self.db_file)
+            if ((db_stat.st_dev, db_stat.st_ino) == self.db_inode and
+                db_stat.st_size == self.db_offset):
+                return
+            self._read_results()
 
     @staticmethod
     def _read_results_lines(results_lines):
-        results = []
+        return atos_db_file._parse_results_lines(results_lines)[0]
+
+    @staticmethod
+    def _parse_results_lines(results_lines):
+        """
+        Returns the list of records read from the given lines and
+        the length of the lines up to the end of the last record.
+        """
+        results, length, parsed = [], 0, 0
         curdict, size, time = {}, None, None
         for line in results_lines:
+            length += len(line)
             words = line.split(':', 4)
             if len(words) < 4: continue  # pragma: uncovered
             # ATOS: target: variant_id: key: value
@@ -155,15 +521,116 @@ class atos_db_file(atos_db):
             curdict['target'] = target
             curdict['variant'] = variant
             results += [result_entry(curdict)]
+            parsed = length
             curdict, size, time = {}, None, None
-        return results
+        return results, parsed
+
+    @staticmethod
+    def _parse_results_file(filename, start, end):
+        """
+        Parses the records of filename from start to end offsets in
+        a pool of processes, returns the same results as a sequential
+        parse with _parse_results_lines.
+        """
+        nchunks = max(1, min(multiprocessing.cpu_count(), (
+                    end - start) // atos_db_file.chunk_min_size))
+        # chunks end after a 'time' line, the last line of a record
+        bounds = [start]
+        with open(filename, 'r') as db_file:
+            for num in range(1, nchunks):
+                db_file.seek(max(bounds[-1], start + (
+                            end - start) * num // nchunks))
+                db_file.readline()  # partial line
+                for line in iter(db_file.readline, ''):
+                    words = line.split(':', 4)
+                    if len(words) == 5 and words[3].strip() == 'time':
+                        break
+                if db_file.tell() >= end: break
+                bounds.append(db_file.tell())
+        chunks = [(filename, chunk_start, chunk_end) for (
+                chunk_start, chunk_end) in zip(bounds, bounds[1:] + [end])]
+        # forked pool processes could be blocked on a lock held by
+        # another thread at fork time: serial parse if threads run
+        if len(chunks) == 1 or threading.active_count() > 1:
+            chunks_results = map(_parse_results_chunk, chunks)
+        else:
+            pool = multiprocessing.Pool(len(chunks))
+            try: chunks_results = pool.map(_parse_results_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        # a chunk following an incomplete record is parsed again
+        # from the start of this record
+        results, offset = [], start
+        for ((_, chunk_start, chunk_end), (chunk_results, parsed)) in zip(
+            chunks, chunks_results):
+            if chunk_start != offset:  # pragma: uncovered
+                chunk_start, (chunk_results, parsed) = (
+                    offset, _parse_results_chunk(
+                        (filename, offset, chunk_end)))
+            results.extend(chunk_results)
+            offset = chunk_start + parsed
+        return results, offset - start
+
+    def _read_cache(self, db_inode, db_size):
+        # parsed results of the file prefix and prefix size, if any
+        try:
+            with open(self.cache_file, 'rb') as cache:
+                cache_inode, offset, results = pickle.load(cache)
+        except Exception: return [], 0
+        if cache_inode != db_inode or offset > db_size:
+            return [], 0
+        return results, offset
+
+    def _write_cache(self, db_inode, results, offset):
+        if process._dryrun: return  # pragma: uncovered
+        try:
+            # atomic replacement, concurrent readers get a full cache
+            with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(self.cache_file) or '.',
+                delete=False) as cache:
+                pickle.dump((db_inode, offset, results), cache, -1)
+            os.rename(cache.name, self.cache_file)
+        except (IOError, OSError):  # pragma: uncovered
+            # read-only shared database: no cache
+            return
 
     def _read_results(self):
-        with atos_db.lock:
-            if not os.path.exists(self.db_file): return  # pragma: uncovered
-            with open(self.db_file, 'r') as db_file:
-                self.results.extend(atos_db_file._read_results_lines(
-                        db_file.readlines()))
+        if not os.path.exists(self.db_file): return  # pragma: uncovered
+        with open(self.db_file, 'r') as db_file:
+            db_stat = os.fstat(db_file.fileno())
+            db_inode = (db_stat.st_dev, db_stat.st_ino)
+            if (db_inode != self.db_inode or
+                db_stat.st_size < self.db_offset):
+                # new or truncated file: full parse
+                self.index, self.db_offset = results_index(), 0
+                self.db_inode = db_inode
+            if db_stat.st_size == self.db_offset: return
+            cached, full_read = [], self.db_offset == 0
+            if full_read and (db_stat.st_size >=
+                              atos_db_file.parallel_min_size):
+                # start after the prefix parsed in the cache, if any
+                cached, self.db_offset = self._read_cache(
+                    db_inode, db_stat.st_size)
+            large = (db_stat.st_size - self.db_offset >=
+                     atos_db_file.parallel_min_size)
+            if not large:
+                db_file.seek(self.db_offset)
+                tail_lines = db_file.readlines()
+        if large:
+            results, parsed = atos_db_file._parse_results_file(
+                self.db_file, self.db_offset, db_stat.st_size)
+            if full_read:
+                self._write_cache(
+                    db_inode, cached + results, self.db_offset + parsed)
+        else:
+            # ignore last line if still being written
+            if tail_lines and not tail_lines[-1].endswith('\n'):
+                tail_lines.pop()  # pragma: uncovered
+            # incomplete last record will be parsed on next read
+            results, parsed = atos_db_file._parse_results_lines(tail_lines)
+        self.index.extend(cached + results)
+        self.db_offset += parsed
 
     def _create(self):
         with atos_db.lock:
@@ -187,66 +654,718 @@ class atos_db_file(atos_db):
         return entry_str
 
 
+def _parse_results_chunk(chunk):
+    """
+    Returns the records of a (filename, start, end) chunk of a text
+    database and the length parsed. Runs in atos_db_file parser pool.
+    """
+    filename, start, end = chunk
+    with open(filename, 'r') as db_file:
+        db_file.seek(start)
+        lines = db_file.read(end - start).splitlines(True)
+    # ignore last line if still being written
+    if lines and not lines[-1].endswith('\n'):
+        lines.pop()  # pragma: uncovered
+    return atos_db_file._parse_results_lines(lines)
+
+
 # ####################################################################
 
 
-class atos_db_json(atos_db):
+class atos_journal():
+    """
+    Base class for databases stored as a snapshot file plus an
+    append-only journal (db_file + '.journal') of the items added since
+    the last compaction. Readers load the snapshot then apply the
+    journal items, refresh() only reading the items appended since the
+    last read. The journal is folded into the snapshot by compact(),
+    which is also triggered when the journal grows over
+    journal_min_size bytes and journal_ratio times the snapshot size,
+    keeping the amortized cost of additions linear. Lock order is
+    always journal then snapshot. A crash between the snapshot write
+    and the journal truncation leaves the last items in both.
+    """
+
+    journal_min_size = 1 << 20
+
+    journal_ratio = 0.25
+
+    # used for locking database before r/w accesses in multithreaded mode
+    lock = threading.RLock()
 
     def __init__(self, db_file):
         self.db_file = db_file
-        self.results = []
+        self.journal_file = db_file + '.journal'
+        # snapshot stat and journal offset at last read
+        self.db_stat, self.journal_offset = None, 0
+        self._reset(self._empty())
         self._create()
-        self._read_results()
+        # db still not created in dryrun mode
+        if os.path.exists(self.db_file):  # pragma: branch_always
+            self.refresh()
+
+    def refresh(self):
+        with self.lock:
+            if not os.path.exists(self.db_file): return  # pragma: uncovered
+            # cheap check of snapshot and journal changes before reading
+            journal_size = (os.path.exists(self.journal_file) and
+                            os.path.getsize(self.journal_file) or 0)
+            if (file_stat(os.stat(self.db_file)) == self.db_stat and
+                journal_size == self.journal_offset):
+                return
+            # journal lock is held while reading the snapshot,
+            # otherwise a concurrent compaction could hide items
+            journal = None
+            if os.path.exists(self.journal_file):
+                journal = process.open_locked(self.journal_file)
+            try:
+                self._read_journal_delta(journal)
+            finally:
+                if journal: journal.close()
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def _add(self, items):
+        with self.lock:
+            if process._dryrun:  # pragma: uncovered
+                self._apply(items)
+                return
+            with process.open_locked(self.journal_file, 'a+') as journal:
+                # get items of other processes before adding ours
+                self._read_journal_delta(journal)
+                journal.seek(0, os.SEEK_END)
+                self._dump_journal(items, journal)
+                journal.flush()
+                self.journal_offset = journal.tell()
+            self._apply(items)
+            if self.journal_offset >= max(
+                self.journal_min_size,
+                self.journal_ratio * os.path.getsize(self.db_file)):
+                self._compact()
+
+    def _compact(self):
+        if process._dryrun: return  # pragma: uncovered
+        with process.open_locked(self.journal_file, 'a+') as journal:
+            with process.open_locked(self.db_file, 'r+') as db_file:
+                journal.seek(0)
+                data = self._fold(
+                    self._load(db_file), self._load_journal(journal))
+                db_file.seek(0)
+                db_file.truncate()
+                self._dump(data, db_file)
+                # journal must be emptied only once snapshot is written
+                db_file.flush()
+                os.fsync(db_file.fileno())
+                journal.truncate(0)
+                self.db_stat = file_stat(os.fstat(db_file.fileno()))
+                self.journal_offset = 0
+
+    def _read_journal_delta(self, journal):
+        # read items added since last read, journal lock must be held
+        with process.open_locked(self.db_file) as db_file:
+            db_stat = file_stat(os.fstat(db_file.fileno()))
+            journal_size = 0
+            if journal:
+                journal.seek(0, os.SEEK_END)
+                journal_size = journal.tell()
+            if (db_stat != self.db_stat or
+                journal_size < self.journal_offset):
+                # new snapshot (compacted by another process): full read
+                self._reset(self._load(db_file))
+                self.db_stat, self.journal_offset = db_stat, 0
+        if not journal or journal_size == self.journal_offset: return
+        journal.seek(self.journal_offset)
+        self._apply(self._load_journal(journal))
+        self.journal_offset = journal.tell()
+
+    def _create(self):
+        if os.path.exists(self.db_file): return
+        with process.open_locked(self.db_file, 'a') as db_file:
+            # may have been created while waiting for the lock
+            db_file.seek(0, os.SEEK_END)
+            if not db_file.tell(): self._dump(self._empty(), db_file)
+
+    def _fold(self, data, items):
+        # snapshot data with items applied, also set as current state
+        self._reset(data)
+        self._apply(items)
+        return self._snapshot()
+
+    # database content, defined by subclasses
+    def _empty(self): raise NotImplementedError
+
+    def _reset(self, data): raise NotImplementedError
+
+    def _apply(self, items): raise NotImplementedError
+
+    def _snapshot(self): raise NotImplementedError
+
+    # snapshot and journal formats, defined by subclasses,
+    # _load_journal leaves the journal after the last complete item
+    def _load(self, db_file): raise NotImplementedError
+
+    def _dump(self, data, db_file): raise NotImplementedError
+
+    def _load_journal(self, journal): raise NotImplementedError
+
+    def _dump_journal(self, items, journal): raise NotImplementedError
+
+
+class atos_json_format():
+    """
+    JSON snapshot and journal of one JSON item per line, for
+    atos_journal databases.
+    """
+
+    def _load(self, db_file):
+        return json.load(db_file)
+
+    def _dump(self, data, db_file):
+        json.dump(data, db_file, sort_keys=True, indent=4)
+
+    def _load_journal(self, journal):
+        # one json item per line, ignore partially written last line
+        items = []
+        for line in iter(journal.readline, ''):
+            try:
+                if not line.endswith('\n'): raise ValueError
+                items.append(json.loads(line))
+            except ValueError:  # pragma: uncovered
+                journal.seek(-len(line), os.SEEK_CUR)
+                break
+        return items
+
+    def _dump_journal(self, items, journal):
+        journal.write(''.join(
+                json.dumps(item, sort_keys=True) + '\n' for item in items))
+
+
+# ####################################################################
+
+
+class atos_db_journal(atos_journal, atos_db):
+    """
+    Base class for results databases stored as an atos_journal: a
+    snapshot file holding the full list of results plus a journal of
+    the results added since the last compaction.
+    """
+
+    lock = atos_db.lock
 
     def get_results(self, query=None):
         with atos_db.lock:
-            return results_filter(self.results, query)
+            return self.index.query(query)
+
+    def get_cookies_results(self, cookies):
+        with atos_db.lock:
+            return self.index.cookies_query(cookies)
+
+    def get_merged_results(self, query=None, merge_targets=True):
+        with atos_db.lock:
+            return self.index.merged_query(query, merge_targets)
+
+    def get_merged_cookies_results(self, cookies):
+        with atos_db.lock:
+            return self.index.merged_cookies_query(cookies)
 
     def add_results(self, entries):
-        with process.open_locked(self.db_file, 'r+') as db_file:
-            self.results = json.load(db_file)
-            db_file.seek(0)
-            db_file.truncate()
-            self.results.extend(entries)
-            json.dump(self.results, db_file, sort_keys=True, indent=4)
+        self._add(entries)
 
-    def _read_results(self):
-        self.results = json.load(process.open_locked(self.db_file))
+    def _empty(self):
+        return []
+
+    def _reset(self, results):
+        self.index = results_index(results)
+
+    def _apply(self, entries):
+        self.index.extend(entries)
+
+    def _fold(self, results, entries):
+        # stored rows, the index holds expanded aggregated rows
+        results = results + entries
+        self._reset(results)
+        return results
+
+
+# ####################################################################
+
+
+class atos_db_json(atos_json_format, atos_db_journal):
+    pass
+
+
+# ####################################################################
+
+
+class atos_db_pickle(atos_db_journal):
+
+    def _load(self, db_file):
+        return pickle.load(db_file)
+
+    def _dump(self, results, db_file):
+        pickle.dump(results, db_file, -1)
+
+    def _load_journal(self, journal):
+        # sequence of pickled entries, ignore partially written last one
+        results = []
+        while True:
+            offset = journal.tell()
+            try: results.append(pickle.load(journal))
+            except (EOFError, pickle.UnpicklingError, ValueError,
+                    IndexError, KeyError):
+                journal.seek(offset)
+                break
+        return results
+
+    def _dump_journal(self, entries, journal):
+        journal.write(''.join(
+                pickle.dumps(entry, -1) for entry in entries))
+
+
+# ####################################################################
+
+
+class atos_db_sqlite(atos_db):
+
+    # fields stored in their own indexed column,
+    # the full entry is stored as a json string
+    index_keys = ['target', 'variant', 'hash', 'cookies', 'session']
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        # db still not created in dryrun mode
+        self.conn = sqlite3.connect(
+            (not process._dryrun or os.path.exists(db_file))
+            and db_file or ':memory:', timeout=60, check_same_thread=False)
+        # same semantic as results_filter: full match, missing key is ''
+        self.conn.create_function(
+            'regexp', 2, lambda expr, value: bool(
+                re.match('^%s$' % expr, value or '')))
+        self._create()
+
+    def get_results(self, query=None):
+        with atos_db.lock:
+            if not query or isinstance(query, str):
+                return results_filter(self._select(), query)
+            # indexed keys are filtered by sqlite, remaining ones by
+            # results_filter on the (hopefully small) selected set
+            where, params, remaining = self._where(query)
+            return results_filter(self._select(where, params), remaining)
+
+    def iter_results(self, query=None):
+        if isinstance(query, str):  # pragma: uncovered
+            return iter(self.get_results(query))
+        where, params, remaining = self._where(query or {})
+        return itertools.ifilter(
+            results_query(remaining), self._iter_select(where, params))
+
+    def get_cookies_results(self, cookies):
+        if not cookies: return self.get_results()  # pragma: uncovered
+        with atos_db.lock:
+            return self._select(
+                'id in (select result from cookies where cookie in (%s))' % (
+                    ', '.join('?' * len(cookies))), list(cookies))
+
+    def add_results(self, entries):
+        with atos_db.lock:
+            if process._dryrun: return  # pragma: uncovered
+            with self.conn:
+                self._insert(entries)
+
+    def replace_results(self, entries):
+        # all results replaced in one transaction, then space reclaimed
+        with atos_db.lock:
+            if process._dryrun: return  # pragma: uncovered
+            with self.conn:
+                self.conn.execute('delete from cookies')
+                self.conn.execute('delete from results')
+                self._insert(entries)
+            self.conn.execute('vacuum')
+
+    def _insert(self, entries):
+        for entry in entries:
+            cursor = self.conn.execute(
+                'insert into results (%s, entry) values (%s)' % (
+                    ', '.join(atos_db_sqlite.index_keys),
+                    ', '.join('?' * (len(atos_db_sqlite.index_keys) + 1))),
+                [entry.get(key, None)
+                 for key in atos_db_sqlite.index_keys] +
+                [json.dumps(entry, sort_keys=True)])
+            self.conn.executemany(
+                'insert into cookies (result, cookie) values (?, ?)',
+                [(cursor.lastrowid, cookie) for cookie in
+                 list_unique(filter(bool, entry.get(
+                                'cookies', '').split(',')))])
+
+    def _where(self, query):
+        # returns (sql condition, parameters, query on remaining keys)
+        where, params, remaining = [], [], {}
+        for (key, value) in query.items():
+            if key not in atos_db_sqlite.index_keys:
+                remaining[key] = value
+                continue
+            # same value conversion as results_filter
+            value = '%s' % value
+            if value == '.*': continue
+            if not value or not results_index.is_literal(value):
+                where += ['regexp(?, %s)' % key]
+                params += [value]
+            else:
+                where += ['%s = ?' % key]
+                params += [value]
+        return ' and '.join(where), params, remaining
+
+    def _select(self, where=None, params=None):
+        rows = self.conn.execute(
+            'select entry from results %s order by id' % (
+                where and 'where ' + where or ''), params or [])
+        return list(expand_results(json.loads(row[0]) for row in rows))
+
+    def _iter_select(self, where=None, params=None, batch_size=1024):
+        # rows are fetched by batches, the lock is not held between them
+        with atos_db.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'select entry from results %s order by id' % (
+                    where and 'where ' + where or ''), params or [])
+        while True:
+            with atos_db.lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows: break
+            for result in expand_results(
+                json.loads(row[0]) for row in rows):
+                yield result
 
     def _create(self):
-        if os.path.exists(self.db_file): return
-        json.dump([], open(self.db_file, 'w'))
+        with atos_db.lock:
+            with self.conn:
+                self.conn.execute(
+                    'create table if not exists results ('
+                    'id integer primary key, %s, entry text)' % (
+                        ', '.join(map(
+                                lambda x: '%s text' % x,
+                                atos_db_sqlite.index_keys))))
+                self.conn.execute(
+                    'create table if not exists cookies ('
+                    'result integer, cookie text)')
+                for key in atos_db_sqlite.index_keys:
+                    self.conn.execute(
+                        'create index if not exists results_%s '
+                        'on results (%s)' % (key, key))
+                self.conn.execute(
+                    'create index if not exists cookies_cookie '
+                    'on cookies (cookie)')
 
 
 # ####################################################################
 
 
-class atos_db_pickle(atos_db):
+class atos_db_binary(atos_db):
+    """
+    Binary results database accessed through mmap, made of a file of
+    fixed-width rows and of a string table file (db_file + '.str').
+    Each row holds the (offset, length) in the string table of the
+    target, variant, hash and cookies values of a result and of its
+    JSON entry.
+    Both files are append-only, strings being written before the rows
+    referencing them. Opening the database only maps the files, queries
+    decode the strings of the rows they test and the JSON entries of
+    the selected rows.
+    """
+
+    magic = 'ATOSBIN2'
+
+    columns = ['target', 'variant', 'hash', 'cookies']
+
+    # (offset, length) of columns and entry strings
+    row = struct.Struct('<' + 'QI' * (len(columns) + 1))
 
     def __init__(self, db_file):
         self.db_file = db_file
-        self.results = []
+        self.strings_file = db_file + '.str'
+        self.rows_map, self.strings_map, self.count = None, None, 0
+        self.db_inode = None
+        # {row: entry} of decoded rows, {(offset, length): string}
+        self.entries, self.strings = {}, {}
         self._create()
-        self._read_results()
+        self.refresh()
 
     def get_results(self, query=None):
         with atos_db.lock:
-            return results_filter(self.results, query)
+            if not query or isinstance(query, str):
+                return results_filter(list(expand_results(
+                            map(self._entry, xrange(self.count)))), query)
+            rows, remaining = self._select(query)
+            return results_filter(list(expand_results(
+                        map(self._entry, rows))), remaining)
+
+    def get_cookies_results(self, cookies):
+        if not cookies: return self.get_results()  # pragma: uncovered
+        with atos_db.lock:
+            cookies = set(cookies)
+            return list(expand_results(map(self._entry, filter(
+                        lambda x: not cookies.isdisjoint(
+                            self._column(x, 'cookies').split(',')),
+                        xrange(self.count)))))
 
     def add_results(self, entries):
-        with process.open_locked(self.db_file, 'r+') as db_file:
-            self.results = pickle.load(db_file)
-            db_file.seek(0)
-            db_file.truncate()
-            self.results.extend(entries)
-            pickle.dump(self.results, db_file, -1)
+        with atos_db.lock:
+            if process._dryrun: return  # pragma: uncovered
+            with process.open_locked(self.db_file, 'ab') as rows_file:
+                with open(self.strings_file, 'ab') as strings_file:
+                    strings_file.seek(0, os.SEEK_END)
+                    strings, strings_data, rows = {}, [], []
+                    offset = [strings_file.tell()]
+
+                    def string_ref(value):
+                        value = atos_db_binary._bytes(value)
+                        if value not in strings:
+                            strings[value] = (offset[0], len(value))
+                            strings_data.append(value)
+                            offset[0] += len(value)
+                        return strings[value]
+
+                    for entry in entries:
+                        refs = map(lambda x: string_ref(entry.get(x, '')),
+                                   atos_db_binary.columns)
+                        refs.append(string_ref(
+                                json.dumps(entry, sort_keys=True)))
+                        rows.append(atos_db_binary.row.pack(
+                                *sum(map(list, refs), [])))
+                    strings_file.write(''.join(strings_data))
+                    strings_file.flush()
+                rows_file.write(''.join(rows))
+                rows_file.flush()
+            # rows file unlocked, as mapping takes a shared lock on it
+            self._map()
+
+    def refresh(self):
+        with atos_db.lock:
+            self._map()
+
+    def _select(self, query):
+        # returns rows selected on columns and query on remaining keys
+        tests, remaining = [], {}
+        for (key, value) in query.items():
+            if key not in atos_db_binary.columns:
+                remaining[key] = value
+                continue
+            # same value conversion as results_filter
+            value = '%s' % value
+            if value == '.*': continue
+            if results_index.is_literal(value):
+                tests.append(lambda x, k=key, v=atos_db_binary._bytes(value):
+                                 self._column(x, k) == v)
+            else:
+                tests.append(lambda x, k=key, m=re.compile(
+                        '^%s$' % value).match: m(self._column(x, k)))
+        rows = filter(lambda x: all(test(x) for test in tests),
+                      xrange(self.count))
+        return rows, remaining
 
-    def _read_results(self):
-        self.results = pickle.load(process.open_locked(self.db_file))
+    @staticmethod
+    def _bytes(value):
+        value = '%s' % value
+        if isinstance(value, unicode): value = value.encode('utf-8')
+        return value
+
+    def _column(self, row, column):
+        values = atos_db_binary.row.unpack_from(
+            self.rows_map,
+            len(atos_db_binary.magic) + row * atos_db_binary.row.size)
+        position = 2 * atos_db_binary.columns.index(column)
+        return self._string(*values[position:position + 2])
+
+    def _string(self, offset, length):
+        key = (offset, length)
+        if key not in self.strings:
+            self.strings[key] = self.strings_map[offset:offset + length]
+        return self.strings[key]
+
+    def _entry(self, row):
+        if row not in self.entries:
+            values = atos_db_binary.row.unpack_from(
+                self.rows_map,
+                len(atos_db_binary.magic) + row * atos_db_binary.row.size)
+            self.entries[row] = json.loads(
+                self.strings_map[values[-2]:values[-2] + values[-1]])
+        return self.entries[row]
+
+    def _map(self, shared_lock=True):
+        # map files again if complete rows were added since last mapping
+        if not os.path.exists(self.db_file): return  # pragma: uncovered
+        rows_file = None
+        while shared_lock:
+            # a shared lock on the rows file ensures that the strings
+            # file is not being replaced (atos lib compact): both files
+            # are renamed while the replaced rows file is locked
+            rows_file = open(self.db_file, 'rb')
+            fcntl.flock(rows_file, fcntl.LOCK_SH)
+            if process._same_file(rows_file, self.db_file): break
+            rows_file.close()
+        try:
+            self._map_files()
+        finally:
+            if rows_file: rows_file.close()
+
+    def _map_files(self):
+        db_stat = os.stat(self.db_file)
+        if (db_stat.st_dev, db_stat.st_ino) != self.db_inode:
+            # new database file (atos lib compact): full mapping
+            self.count, self.entries, self.strings = 0, {}, {}
+            self.db_inode = (db_stat.st_dev, db_stat.st_ino)
+        count = max(0, (db_stat.st_size - len(
+                    atos_db_binary.magic)) // atos_db_binary.row.size)
+        if count == self.count: return
+        assert count > self.count, 'truncated database %s' % self.db_file
+        # strings are written first: map them after rows file size check
+        with open(self.strings_file, 'rb') as strings_file:
+            self.strings_map = mmap.mmap(
+                strings_file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.db_file, 'rb') as rows_file:
+            assert rows_file.read(len(atos_db_binary.magic)) == (
+                atos_db_binary.magic), 'invalid database %s' % self.db_file
+            self.rows_map = mmap.mmap(
+                rows_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = count
 
     def _create(self):
-        if os.path.exists(self.db_file): return
-        pickle.dump([], open(self.db_file, 'w'), -1)
+        with atos_db.lock:
+            if os.path.exists(self.db_file): return
+            with open(self.strings_file, 'ab'): pass
+            with open(self.db_file, 'wb') as db_file:
+                db_file.write(atos_db_binary.magic)
+
+
+# ####################################################################
+
+
+# {database type: (file name, class)}, in atos_db.db() selection order
+db_types = [
+    ('sqlite', ('results.sqlite', atos_db_sqlite)),
+    ('binary', ('results.bin', atos_db_binary)),
+    ('pickle', ('results.pkl', atos_db_pickle)),
+    ('json', ('results.json', atos_db_json)),
+    ('results_db', ('results.db', atos_db_file))]
+
+def compact_db(configuration_path, db_type=None, aggregate=False,
+               failures='keep'):
+    """
+    Rewrites the database of configuration_path without duplicates,
+    with runs aggregated if aggregate is set (see compact_results), and
+    without failures if failures is 'drop' or 'archive' (failures then
+    appended as JSON lines to results.failures.json). The database is
+    converted to db_type if given and differs from its current type.
+    Processes adding results wait for the end of the compaction: the
+    files they lock are held locked and replaced by renaming, then
+    process.open_locked() locks the new files. As the database objects
+    of other processes would keep using the removed files, a database
+    opened by other processes is not converted (RuntimeError), and
+    processes opening it wait for the end of the conversion.
+    Returns (number of results, of rows written, of failures).
+    """
+    with atos_db.lock:
+        return _compact_db(configuration_path, db_type, aggregate, failures)
+
+def _compact_db(configuration_path, db_type, aggregate, failures):
+    db = atos_db.db(configuration_path)
+    src_type = [x for (x, (_, y)) in db_types if isinstance(db, y)][0]
+    db_type = db_type or src_type
+    db_file = os.path.join(configuration_path, dict(db_types)[db_type][0])
+    converted = db_type != src_type
+    locked = []
+    try:
+        if converted: _lock_conversion(configuration_path)
+        # lock out add_results of other processes, read all results
+        if isinstance(db, atos_db_journal):
+            locked.append(process.open_locked(db.journal_file, 'a+'))
+            db._read_journal_delta(locked[-1])
+        elif isinstance(db, atos_db_sqlite):
+            db.conn.execute('begin immediate')
+        elif isinstance(db, atos_db_binary):
+            locked.append(process.open_locked(db.db_file, 'a'))
+            db._map(shared_lock=False)
+        else:
+            locked.append(process.open_locked(db.db_file, 'a'))
+            db.refresh()
+        results = db.get_results()
+        compacted, failed = compact_results(results, aggregate)
+        if failures == 'keep': compacted += failed
+        stats = (len(results), len(compacted), len(failed))
+        if process._dryrun: return stats  # pragma: uncovered
+        if src_type == db_type == 'sqlite':
+            db.replace_results(compacted)
+        else:
+            _write_db(db_type, db_file, compacted,
+                      os.stat(db.db_file).st_mode & 0777)
+            if converted: _remove_db(db.db_file)
+        if failures == 'archive':
+            with process.open_locked(os.path.join(
+                    configuration_path,
+                    'results.failures.json'), 'a') as archive:
+                pprint_lines(failed, archive)
+    finally:
+        if isinstance(db, atos_db_sqlite): db.conn.rollback()
+        for lockf in locked: lockf.close()
+        if converted: _unlock_conversion(configuration_path)
+    # next atos_db.db() call opens the new database
+    atos_db.db_cache.pop(os.path.abspath(db.db_file), None)
+    return stats
+
+def _lock_conversion(configuration_path):
+    # fails if other processes hold the shared lock taken by atos_db.db()
+    lock_fd = atos_db.db_locks.get(os.path.abspath(configuration_path))
+    if lock_fd is None: return  # pragma: uncovered
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError, e:
+        if e.errno not in [errno.EWOULDBLOCK, errno.EAGAIN]:
+            raise  # pragma: uncovered
+        # lock conversion is not atomic, take the shared lock again
+        fcntl.flock(lock_fd, fcntl.LOCK_SH)
+        raise RuntimeError('database %s in use by other processes' % (
+                os.path.abspath(configuration_path)))
+
+def _unlock_conversion(configuration_path):
+    lock_fd = atos_db.db_locks.get(os.path.abspath(configuration_path))
+    if lock_fd is None: return  # pragma: uncovered
+    fcntl.flock(lock_fd, fcntl.LOCK_SH)
+
+def _write_db(db_type, db_file, results, mode):
+    # write a new database of given type, then rename it to db_file
+    tmp_file = db_file + '.compact'
+    for filename in [tmp_file, tmp_file + '.str', tmp_file + '.journal']:
+        if os.path.exists(filename): os.remove(filename)
+    if db_type == 'results_db':
+        with open(tmp_file, 'w') as tmpf:
+            tmpf.write(''.join(map(atos_db_file.entry_str, results)))
+    elif db_type in ['json', 'pickle']:
+        db = dict(db_types)[db_type][1](tmp_file)
+        with open(tmp_file, 'w') as tmpf:
+            db._dump(results, tmpf)
+    elif db_type == 'binary':
+        atos_db_binary(tmp_file).add_results(results)
+        # strings first, readers map both files under a shared lock of
+        # the rows file, held exclusively by the compaction if replaced
+        os.chmod(tmp_file + '.str', mode)
+        os.rename(tmp_file + '.str', db_file + '.str')
+    elif db_type == 'sqlite':  # pragma: branch_always
+        db = atos_db_sqlite(tmp_file)
+        db.add_results(results)
+        db.conn.close()
+    os.chmod(tmp_file, mode)
+    os.rename(tmp_file, db_file)
+    # journal of the replaced snapshot (held locked) or stale journal
+    if os.path.exists(db_file + '.journal'):
+        open(db_file + '.journal', 'w').close()
+
+def _remove_db(db_file):
+    # files of a converted database
+    for filename in [db_file, db_file + '.journal',
+                     db_file + '.str', db_file + '.cache']:
+        if os.path.exists(filename): os.remove(filename)
 
 
 # ####################################################################
@@ -254,11 +1373,48 @@ class atos_db_pickle(atos_db):
 
 class atos_client_results():
 
-    class result():
+    class result(object):
+        """
+        Result record built from a result dict, each field being an
+        attribute. Standard fields are stored in slots, other fields go
+        to the instance dict, which is only created for these extras.
+        """
+
+        # standard fields of result records and computed fields
+        field_names = [
+            'target', 'variant', 'version', 'conf', 'uconf', 'gconf',
+            'time', 'size', 'cookies', 'hash', 'environment', 'compiler',
+            'dataset', 'session', 'speedup', 'sizered', 'on_frontier',
+            '_results', '_last']
+
+        __slots__ = field_names + ['__dict__']
 
         def __init__(self, result):
-            for (key, val) in result.items():
-                exec 'self.%s = type(%s)("%s")' % (key, 'val', val)
+            field_value = atos_client_results.result.field_value
+            for (key, val) in result.iteritems():
+                setattr(self, key, field_value(val))
+
+        @staticmethod
+        def field_value(val):
+            # values are converted through their string representation
+            # (floats are thus rounded to their str() precision)
+            val_type = type(val)
+            if val_type is float: return float(str(val))
+            if val_type in [str, unicode, int]: return val
+            return val_type('%s' % val)
+
+        @staticmethod
+        def records(results):
+            """ Returns the list of result objects of result dicts. """
+            result_type = atos_client_results.result
+            new, field_value = result_type.__new__, result_type.field_value
+            records = []
+            for result in results:
+                record = new(result_type)
+                for (key, val) in result.iteritems():
+                    setattr(record, key, field_value(val))
+                records.append(record)
+            return records
 
         def __repr__(self):
             return '<%s:%s>' % (self.target, self.variant)
@@ -266,9 +1422,23 @@ class atos_client_results():
         def __str__(self):  # pragma: uncovered
             return str(self.dict())
 
+        def fields(self):
+            """ Dict of all fields, including internal ones. """
+            fields = dict(self.__dict__)
+            for name in atos_client_results.result.field_names:
+                if hasattr(self, name): fields[name] = getattr(self, name)
+            return fields
+
+        def copy(self):
+            newobj = atos_client_results.result.__new__(
+                atos_client_results.result)
+            for (key, val) in self.fields().iteritems():
+                setattr(newobj, key, val)
+            return newobj
+
         def dict(self):
             return dict(
-                filter(lambda x: x[0][0] != '_', self.__dict__.items()))
+                filter(lambda x: x[0][0] != '_', self.fields().items()))
 
         def compute_speedup(self, ref):
             self.speedup = ((float(ref.time) / float(self.time)) - 1.0)
@@ -277,23 +1447,23 @@ class atos_client_results():
 
         @staticmethod
         def merge_multiple_runs(results):
-            newobj = atos_client_results.result(results[0].__dict__)
+            newobj = results[0].copy()
             # average of execution times
-            newobj.time = average(map(lambda x: x.time, results))
+            newobj.time = average(map(lambda x: float(x.time), results))
             newobj._results = results
             return newobj
 
         @staticmethod
         def merge_targets(group_name, results):
-            newobj = atos_client_results.result(results[0].__dict__)
+            newobj = results[0].copy()
             # geometric mean of execution times, sum of binary sizes
             newobj.time = geometric_mean(map(lambda x: x.time, results))
             newobj.size = sum(map(lambda x: x.size, results))
             newobj.target = group_name
             # last group results - last result of each target
-            newobj._last = atos_client_results.result(newobj.__dict__)
+            newobj._last = newobj.copy()
             newobj._last.time = geometric_mean(
-                map(lambda x: x._results[-1].time, results))
+                map(lambda x: float(x._results[-1].time), results))
             newobj._results = results
             return newobj
 
@@ -320,23 +1490,34 @@ class atos_client_results():
 
     @staticmethod
     def set_frontier_field(results):
-        maybe_on_frontier, mustbe_on_frontier = list(results), set()
-        for c1 in results:
-            on_frontier = True
-            maybe_on_frontier.remove(c1)
-            for c2 in itertools.chain(mustbe_on_frontier, maybe_on_frontier):
-                if (c2.time == c1.time and c2.size == c1.size
-                    ):  # pragma: uncovered
-                    pass
-                elif c2.time <= c1.time and c2.size <= c1.size:
-                    on_frontier = False
-                    break
-            if on_frontier: mustbe_on_frontier.add(c1)
-            c1.on_frontier = on_frontier
+        if results_columns.enabled(results):
+            columns = results_columns(results)
+            columns.on_frontier = columns.frontier_mask()
+            columns.set_fields('on_frontier')
+            return
+        # sweep results by increasing size: a result is on the frontier
+        # if its time is the best one for its size and is strictly
+        # better than the times of all results of smaller size
+        best_time = None
+        for (size, group) in itertools.groupby(
+            sorted(results, key=lambda x: x.size), key=lambda x: x.size):
+            group = list(group)
+            group_time = min(map(lambda x: x.time, group))
+            for result in group:
+                result.on_frontier = result.time == group_time and (
+                    best_time is None or group_time < best_time)
+            if best_time is None or group_time < best_time:
+                best_time = group_time
 
     def compute_speedups(self, ref_variant='REF'):
         if not self.results: return []  # pragma: uncovered
         assert ref_variant in self.results.keys()
+        results = self.results.values()
+        if results_columns.enabled(results):
+            columns = results_columns(results)
+            columns.compute_speedups(self.results[ref_variant])
+            columns.set_fields('speedup', 'sizered')
+            return results
         for (variant, result) in self.results.items():
             result.compute_speedup(self.results[ref_variant])
         return self.results.values()
@@ -373,6 +1554,9 @@ class atos_client_results():
         # speedups must be already computed
         assert all(map(lambda x: getattr(
                     x, 'speedup', None) is not None, frontier))
+        if results_columns.enabled(frontier):
+            return results_columns(frontier).select_tradeoffs(
+                perf_size_ratio, nb_points)
         # find best tradeoff (ratio * speedup + sizered)
         # this is the higher ordinate value at abscissa 0
         tradeoffs = map(lambda x: (
@@ -410,19 +1594,202 @@ class atos_client_results():
         reslist = self.db.get_results(full_query)
         # create results dict
         results = {}  # {variant: [result_obj]}
-        for res in reslist:
-            if 'FAILURE' in [res['size'], res['time']]:  # pragma: uncovered
-                continue
-            results.setdefault(res['variant'], []).append(
-                atos_client_results.result(res))
+        for res in atos_client_results.result.records(filter(
+                lambda x: 'FAILURE' not in [x['size'], x['time']], reslist)):
+            results.setdefault(res.variant, []).append(res)
         # merge multiple runs (average execution times)
         for variant in results.keys():
             results[variant] = atos_client_results.result.merge_multiple_runs(
                 results[variant])
         return results
 
+class results_frontier():
+    """
+    Pareto frontier on (size, time) of results, maintained incrementally.
+    A result is on the frontier if no other result has a lower or equal
+    size and time, as in atos_client_results.set_frontier_field.
+    Frontier points are kept sorted by increasing size, thus decreasing
+    time, so that an insertion is a bisection followed by the removal
+    of the points dominated by the new result.
+    """
+
+    def __init__(self, results=None):
+        # sorted (size, time) of frontier points
+        self.keys = []
+        # [result] of each frontier point
+        self.points = []
+        map(self.insert, results or [])
+
+    def insert(self, result):
+        """
+        Insert result, update on_frontier fields of result and of the
+        results it removes from the frontier.
+        """
+        key = (result.size, result.time)
+        pos = bisect.bisect_left(self.keys, key)
+        if pos < len(self.keys) and self.keys[pos] == key:
+            self.points[pos].append(result)
+            result.on_frontier = True
+            return True
+        if pos > 0 and self.keys[pos - 1][1] <= result.time:
+            result.on_frontier = False
+            return False
+        end = pos
+        while end < len(self.keys) and self.keys[end][1] >= result.time:
+            for dominated in self.points[end]:
+                dominated.on_frontier = False
+            end += 1
+        self.keys[pos:end] = [key]
+        self.points[pos:end] = [[result]]
+        result.on_frontier = True
+        return True
+
+    def results(self):
+        """ Frontier results sorted by increasing size. """
+        return sum(self.points, [])
+
+class results_columns():
+    """
+    Columnar view of a list of result objects for vectorized analysis,
+    requires the optional numpy module.
+    Columns are float arrays of time, size, speedup and sizered (nan if
+    not computed) and integer codes of target and variant, the code of
+    a target being its position in the sorted list of target names.
+    Cookies are given as (cookie_rows, cookie_codes) pairs of arrays.
+    """
+
+    # minimum number of results for which columns are used
+    min_size = 1024
+
+    @staticmethod
+    def enabled(results):
+        return numpy is not None and len(results) >= results_columns.min_size
+
+    def __init__(self, results):
+        def column(name):
+            return numpy.array(map(
+                    lambda x: getattr(x, name, None), self.results),
+                               dtype=float)
+
+        def codes(values):
+            names, codes = numpy.unique(
+                numpy.array(values, dtype=object), return_inverse=True)
+            return list(names), codes
+
+        self.results = list(results)
+        self.time, self.size = column('time'), column('size')
+        self.speedup, self.sizered = column('speedup'), column('sizered')
+        self.targets, self.target_codes = codes(
+            map(lambda x: x.target, self.results))
+        self.variants, self.variant_codes = codes(
+            map(lambda x: x.variant, self.results))
+        cookies = [(row, cookie) for (row, result) in enumerate(self.results)
+                   for cookie in (getattr(result, 'cookies', None) or ''
+                                  ).split(',') if cookie]
+        self.cookie_rows = numpy.array(
+            map(lambda x: x[0], cookies), dtype=int)
+        self.cookies, self.cookie_codes = codes(
+            map(lambda x: x[1], cookies))
+
+    def set_fields(self, *names):
+        """ Copy given columns back to the fields of result objects. """
+        for name in names:
+            for (result, value) in zip(
+                self.results, getattr(self, name).tolist()):
+                setattr(result, name, value)
+
+    def compute_speedups(self, ref):
+        """ Same as compute_speedup of each result object. """
+        self.speedup = (float(ref.time) / self.time) - 1.0
+        self.sizered = 1.0 - (self.size / float(ref.size))
+        return self.speedup, self.sizered
+
+    def tradeoffs(self, perf_size_ratio=4):
+        return (perf_size_ratio * self.speedup) + self.sizered
+
+    def select_tradeoffs(self, perf_size_ratio=4, nb_points=3):
+        """ Same as atos_client_results.select_tradeoffs. """
+        order = numpy.lexsort(
+            (self.variant_codes, self.tradeoffs(perf_size_ratio)))
+        return map(lambda x: self.results[x], order[-nb_points:])
+
+    def frontier_mask(self):
+        """ Same as atos_client_results.set_frontier_field. """
+        if not self.results: return numpy.zeros(0, dtype=bool)
+        # sort by size then time, the first result of each size group
+        # has the best time of the group
+        order = numpy.lexsort((self.time, self.size))
+        size, time = self.size[order], self.time[order]
+        first = numpy.ones(len(order), dtype=bool)
+        first[1:] = size[1:] != size[:-1]
+        group_time = time[first]
+        best_time = numpy.empty(len(group_time))
+        best_time[0] = numpy.inf
+        best_time[1:] = numpy.minimum.accumulate(group_time)[:-1]
+        groups = numpy.cumsum(first) - 1
+        mask = numpy.empty(len(order), dtype=bool)
+        mask[order] = ((time == group_time[groups]) &
+                       (group_time[groups] < best_time[groups]))
+        return mask
+
+    def group_statistics(self, codes, values=None):
+        """
+        Arrays of average, min, max and standard deviation of values
+        (default to time) for each code, as average(), min(), max()
+        and standard_deviation() on each group.
+        """
+        values = self.time if values is None else values
+        counts = numpy.bincount(codes)
+        avg = numpy.bincount(codes, weights=values) / counts
+        order = numpy.lexsort((values, codes))
+        starts = numpy.cumsum(counts) - counts
+        sorted_values = values[order]
+        minimum = sorted_values[starts]
+        maximum = sorted_values[starts + counts - 1]
+        stdev = numpy.sqrt(numpy.bincount(
+                codes, weights=(values - avg[codes]) ** 2) / counts)
+        return avg, minimum, maximum, stdev
+
+    def cookie_groups(self, cookie_to_group):
+        """
+        Array of the group of each result, given by the first of its
+        cookies found in cookie_to_group ({cookie: group number}),
+        -1 if none is found.
+        """
+        cookie_groups = numpy.array(map(
+                lambda x: cookie_to_group.get(x, -1), self.cookies),
+                                    dtype=int)
+        pair_groups = cookie_groups[self.cookie_codes]
+        matched = pair_groups >= 0
+        rows, first = numpy.unique(
+            self.cookie_rows[matched], return_index=True)
+        groups = numpy.empty(len(self.results), dtype=int)
+        groups.fill(-1)
+        groups[rows] = pair_groups[matched][first]
+        return groups
+
+def results_statistics(results, key='variant'):
+    """
+    Return {key value: (average, min, max, standard deviation)} of the
+    execution times of results grouped on given key.
+    """
+    if results_columns.enabled(results):
+        columns = results_columns(results)
+        names, codes = {
+            'target': (columns.targets, columns.target_codes),
+            'variant': (columns.variants, columns.variant_codes)}[key]
+        statistics = map(lambda x: x.tolist(),
+                         columns.group_statistics(codes))
+        return dict(zip(names, zip(*statistics)))
+    groups = {}
+    for result in results:
+        groups.setdefault(getattr(result, key), []).append(result.time)
+    return dict(map(lambda (name, values): (name, (
+                    average(values), min(values), max(values),
+                    standard_deviation(values))), groups.items()))
+
 def get_results(dbpath, opts):
-    db = atos_db.db(dbpath, no_cache=True)
+    db = atos_db.db(dbpath)
     results = db.get_results()
     if opts.targets:  # pragma: uncovered
         filtered = []
@@ -450,8 +1817,7 @@ def merge_results(results, merge_targets=True):
         lambda x: "FAILURE" not in x.values(), results)
     if not results: return None
     # transform into result objects
-    results = map(
-        atos_client_results.result, results)
+    results = atos_client_results.result.records(results)
     # compute merged results for each variant
     variants = {}
     ordered_variants = []
@@ -489,7 +1855,9 @@ class atos_client_db():
     def query(self, query=None, replacement=None):
         return atos_client_db.db_query(self.db, query, replacement)
 
-    def add_result(self, entry):
+    def add_result(self, entry, queued=False):
+        # queued results are written by the write-behind queue,
+        # atos_db_writer.flush_results() must be called before reading them
         required_fields = set(atos_db.required_fields)
         if not set(entry.keys()).issuperset(
             required_fields):   # pragma: uncovered (error)
@@ -497,18 +1865,40 @@ class atos_client_db():
                 required_fields.difference(set(entry.keys())))
             return False, 'missing fields: %s' % str(missing_fields)
         entry = result_entry(entry)
-        self.db.add_results([entry])
+        if queued:
+            atos_db_writer.queue_results(self.db, [entry])
+        else:
+            self.db.add_results([entry])
         return True, entry
 
     @staticmethod
     def db_load(inf):
-        return json.load(inf)
+        return list(atos_client_db.db_iter_load(inf))
+
+    @staticmethod
+    def db_iter_load(inf):
+        """
+        Iterate on the results read from inf, either a JSON list as
+        output by db_dump or JSON lines as output by db_dump_lines.
+        JSON lines are read and decoded one at a time.
+        """
+        first = inf.readline()
+        if first.lstrip()[:1] == '{':
+            return itertools.imap(json.loads, itertools.ifilter(
+                    str.strip, itertools.chain([first], inf)))
+        data = first + inf.read()
+        if data.strip() in ['', 'None']: return iter([])
+        return iter(json.loads(data))
 
     @staticmethod
     def db_dump(results, outf):
         pprint_list(results, outf)
         return True, len(results)
 
+    @staticmethod
+    def db_dump_lines(results, outf):
+        return True, pprint_lines(results, outf)
+
     @staticmethod
     def db_query(db, query=None, replacement=None):
         results = db.get_results(query)
@@ -518,17 +1908,46 @@ class atos_client_db():
         return results
 
     @staticmethod
-    def db_transfer(db, results, force):
-        required_keys, missing_keys = set(atos_db.required_keys), set()
-        if not force:  # pragma: uncovered
-            result_keys = set(results.keys())
-            for result in results:
-                if not result_keys.issuperset(required_keys):
-                    missing_keys |= required_keys.difference(result_keys)
-        if missing_keys:  # pragma: uncovered (error)
-            return False, 'missing keys: %s' % str(missing_keys)
-        db.add_results(results)
-        return True, len(results)
+    def db_iter_query(db, query=None, replacement=None):
+        for result in db.iter_results(query):
+            if replacement:  # pragma: uncovered
+                result = dict(result, **replacement)
+            yield result
+
+    @staticmethod
+    def db_transfer(db, results, force, chunk_size=1024, duplicates=False):
+        """
+        Add results, any iterable, to db by chunks. Unless duplicates is
+        set, results already in db are skipped: each content hash of db
+        cancels one occurrence of the same result in the input, so that
+        transfers are idempotent while repeated runs are still kept.
+        Returns the numbers of added and skipped results.
+        """
+        required_keys, count, skipped = set(atos_db.required_keys), 0, 0
+        existing = collections.Counter()
+        if not duplicates:
+            existing.update(itertools.imap(result_hash, db.iter_results()))
+        results = iter(results)
+        while True:
+            chunk = list(itertools.islice(results, chunk_size))
+            if not chunk: break
+            missing_keys = set()
+            if not force:  # pragma: uncovered
+                for result in chunk:
+                    missing_keys |= required_keys.difference(result.keys())
+            if missing_keys:  # pragma: uncovered (error)
+                return False, 'missing keys: %s' % str(missing_keys)
+            added = []
+            for result in chunk:
+                digest = existing and result_hash(result)
+                if digest and existing[digest] > 0:
+                    existing[digest] -= 1
+                    continue
+                added.append(result)
+            if added: db.add_results(added)
+            count += len(added)
+            skipped += len(chunk) - len(added)
+        return True, (count, skipped)
 
 
 # ####################################################################
@@ -536,6 +1955,11 @@ class atos_client_db():
 
 class json_config():
 
+    # {config file path: (file_stat, json_config)}, see cached()
+    cache = {}
+
+    cache_lock = threading.Lock()
+
     def __init__(self, cfgpath):
         filename = os.path.isdir(cfgpath) and os.path.join(
             cfgpath, 'config.json') or cfgpath
@@ -544,6 +1968,24 @@ class json_config():
         with open(self.filename) as inf:
             self.config = json.load(inf)
 
+    @staticmethod
+    def cached(cfgpath):
+        """
+        Returns the json_config of an existing configuration shared by
+        all threads, parsed again only when the file changed.
+        The returned configuration and values must not be modified.
+        """
+        filename = os.path.abspath(os.path.isdir(cfgpath) and os.path.join(
+                cfgpath, 'config.json') or cfgpath)
+        # stat before parsing: a concurrent change is seen on next call
+        stat = file_stat(os.stat(filename))
+        with json_config.cache_lock:
+            entry = json_config.cache.get(filename)
+            if entry and entry[0] == stat: return entry[1]
+            config = json_config(filename)
+            json_config.cache[filename] = (stat, config)
+            return config
+
     def _create(self):
         if os.path.exists(self.filename): return
         self.config = {}
@@ -552,6 +1994,9 @@ class json_config():
     def _dump(self):
         json.dump(self.config, open(self.filename, 'w'),
                   sort_keys=True, indent=4)
+        # file may be rewritten with the same size in the same mtime tick
+        with json_config.cache_lock:
+            json_config.cache.pop(os.path.abspath(self.filename), None)
 
     def _compiler_features(self):
         feature_sets = []
@@ -1044,6 +2489,97 @@ def md5sum(s):
 def sha1sum(s):
     return hashlib.sha1(s).hexdigest()
 
+def result_hash(result):
+    """
+    Returns the content hash of a result, independent of the order of
+    its keys and of the type of its values ("1.5" and 1.5 are equal).
+    """
+    items = sorted(u'%s=%s' % item for item in dict(result).items())
+    return hashlib.md5(u'\n'.join(items).encode('utf-8')).digest()
+
+class results_watermark():
+    """
+    Iterator on the results following a watermark, a position in the
+    results stream returned by watermark() after iteration. The
+    watermark "COUNT:HASH" holds the content hash of the result at
+    position COUNT - 1, checked when skipping the first COUNT results,
+    so that a stream that changed before the watermark (compacted
+    database, different query or replacement) is detected: ValueError
+    is then raised. A plain COUNT position is not checked.
+    """
+    def __init__(self, results, since='0'):
+        count, _, digest = ('%s' % since).partition(':')
+        self.results, self.count, self.last = iter(results), 0, None
+        for result in itertools.islice(self.results, int(count)):
+            self.count, self.last = self.count + 1, result
+        if self.count < int(count) or digest and (
+            digest != self._digest(self.last)):
+            raise ValueError(
+                'stale watermark %s: results changed before it' % since)
+
+    def __iter__(self): return self
+
+    def next(self):
+        result = self.results.next()
+        self.count, self.last = self.count + 1, result
+        return result
+
+    def watermark(self):
+        if self.last is None: return '%d' % self.count
+        return '%d:%s' % (self.count, self._digest(self.last))
+
+    @staticmethod
+    def _digest(result):
+        return result_hash(result).encode('hex')[:12]
+
+def expand_results(results):
+    """
+    Iterate on results, aggregated results (see compact_results) being
+    expanded back into one result per run.
+    """
+    for result in results:
+        if 'times' not in result:
+            yield result
+            continue
+        for time in result['times'].split(','):
+            run = dict(result, time=float(time))
+            del run['times']
+            yield run
+
+def compact_results(results, aggregate=False):
+    """
+    Returns (results, failures), results without exact duplicates and
+    without failures. If aggregate is set, the runs differing only by
+    their time are folded in one result holding the average time and
+    the raw run times ('times' key) expanded by expand_results.
+    """
+    compacted, failures, hashes, runs = [], [], set(), {}
+    for result in results:
+        digest = result_hash(result)
+        if digest in hashes: continue
+        hashes.add(digest)
+        if 'FAILURE' in result.values():
+            failures.append(result)
+            continue
+        if not aggregate:
+            compacted.append(result)
+            continue
+        key = result_hash(dict(result, time=None))
+        if key not in runs:
+            runs[key] = []
+            compacted.append(runs[key])
+        runs[key].append(result)
+    if aggregate:
+        compacted = map(lambda x: len(x) == 1 and x[0] or dict(
+                x[0], time=average(map(lambda y: float(y['time']), x)),
+                times=','.join(map(lambda y: repr(float(y['time'])), x))),
+                        compacted)
+    return compacted, failures
+
+def file_stat(stat):
+    """ Returns (inode, size, mtime) of a stat result, to detect changes. """
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
 def list_unique(seq):
     """
     Returns a new list with no duplicate elements.
@@ -1226,12 +2762,13 @@ def get_oprofile_path(configuration_path, variant):
 def get_config_value(configuration_path, key, default=None):
     config_file = os.path.join(configuration_path, 'config.json')
     if not os.path.isfile(config_file): return default
-    return json_config(config_file).get_value(key, default)
+    return json_config.cached(config_file).get_value(key, default)
 
 def query_config_values(configuration_path, query, default=None):
     config_file = os.path.join(configuration_path, 'config.json')
     if not os.path.isfile(config_file): return default  # pragma: uncovered
-    return json_config(config_file).query(strtoquery(query)) or default
+    return json_config.cached(config_file).query(
+        strtoquery(query)) or default
 
 def get_available_optim_variants(configuration_path):
     variants = ['lto', 'fdo', 'lipo']
@@ -1272,9 +2809,25 @@ def results_filter(results, query):
     if not query: return results
     if isinstance(query, str):
         return jsonlib.search(results, query)
-    return (filter(lambda x: all(
-                map(lambda (k, v): re.match('^%s$' % v, x.get(k, '')),
-                    query.items())), results))
+    return filter(results_query(query), results)
+
+def results_query(query):
+    """
+    Returns a predicate on results for the given dict query.
+    Each value must fully match the result value for its key ('' if
+    missing). Literal values are compared, regexps are compiled once,
+    '.*' values are ignored and the predicate stops at first mismatch.
+    """
+    tests = []
+    for (key, value) in query.items():
+        value = '%s' % value
+        if value == '.*': continue
+        if results_index.is_literal(value):
+            tests.append(lambda x, k=key, v=value: x.get(k, '') == v)
+        else:
+            tests.append(lambda x, k=key, m=re.compile(
+                    '^%s$' % value).match: m(x.get(k, '')))
+    return lambda x: all(test(x) for test in tests)
 
 def results_filter_cookie(results, cookie):
     if not cookie: return results  # pragma: uncovered
@@ -1329,6 +2882,15 @@ def pprint_list(list, out=None, text=False):
             json.dumps(list[i]), ((i + 1) < nb_elems) and ',\n' or ''),
     print >>out, ']'
 
+def pprint_lines(list, out=None):
+    # JSON lines output, one element per line, returns elements count
+    out = out or sys.stdout
+    count = 0
+    for elem in list:
+        print >>out, json.dumps(elem)
+        count += 1
+    return count
+
 def pprint_table(results, out=None, reverse=False):
     out = out or sys.stdout
     xmax, ymax = len(results[0]), len(results)
@@ -1497,6 +3059,10 @@ def timeout_command():
         timeout = timeout and process.cmdline2list(timeout) or []
     return timeout
 
+def affinity_command(cpus):
+    if not cpus: return []
+    return ["taskset", "-c", cpus]
+
 def driver_path():
     atos_driver = os.getenv("ATOS_DRIVER") or os.path.join(
         globals.BINDIR, "atos-driver")
@@ -1731,35 +3297,57 @@ class repeattimer():
 # ####################################################################
 
 
-class atos_cookie_db_json():
+class atos_json_journal(atos_json_format, atos_journal):
+    """
+    Base class for the JSON databases of events (cookies, hashsums),
+    stored as an atos_journal whose journal items are the events.
+    Events must be idempotent, as they may be applied twice.
+    """
+
+    journal_min_size = 1 << 16
+
+
+class atos_cookie_db_json(atos_json_journal):
+    """
+    Cookies database {cookie: {'succs': [cookie], 'description': descr,
+    'userset': True}} stored in cookies.db, the journal events being
+    the added cookies [cookie, parent, description, userset].
+    """
 
     db_cache = {}
 
     def __init__(self, atos_config):
-        self.db_file = os.path.join(
-            atos_config, "cookies.db")
-        # create db file if not already existing
-        if not os.path.exists(self.db_file):
-            json.dump({}, open(self.db_file, 'w'))
-        self.cookies = {}
-        # db still not created in dryrun mode
-        if os.path.exists(self.db_file):
-            self.cookies = json.load(
-                process.open_locked(self.db_file))
+        atos_json_journal.__init__(
+            self, os.path.join(atos_config, "cookies.db"))
 
     def add_cookie(self, value, parent=None, description=None, userset=False):
-        cookie = self.cookies.setdefault(value, {})
-        if description:
-            cookie['description'] = description
-        if userset:
-            cookie['userset'] = True
-        if parent:
-            parent_node = self.cookies.setdefault(parent, {})
-            parent_node.setdefault('succs', []).append(value)
-            parent_node['succs'] = list_unique(parent_node['succs'])
-        # dump resulting db
-        with process.open_locked(self.db_file, 'w') as db_file:
-            json.dump(self.cookies, db_file, sort_keys=True, indent=4)
+        self._add([[value, parent, description, userset]])
+
+    def _empty(self):
+        return {}
+
+    def _reset(self, data):
+        # {parent: set(succs)} index of cookies successors
+        self.cookies, self.succs = data, {}
+
+    def _snapshot(self):
+        return self.cookies
+
+    def _apply(self, events):
+        for (value, parent, description, userset) in events:
+            cookie = self.cookies.setdefault(value, {})
+            if description:
+                cookie['description'] = description
+            if userset:
+                cookie['userset'] = True
+            if not parent: continue
+            succs = self.cookies.setdefault(
+                parent, {}).setdefault('succs', [])
+            if parent not in self.succs:
+                self.succs[parent] = set(succs)
+            if value in self.succs[parent]: continue
+            self.succs[parent].add(value)
+            succs.append(value)
 
     @staticmethod
     def cookie_db(atos_config):
@@ -1818,37 +3406,48 @@ def env_command(*args, **kwargs):
 # ####################################################################
 
 
-class atos_buildhash_db():
+class atos_buildhash_db(atos_json_journal):
     """
-    Database used for storing hashsum_to_variant map.
+    Database used for storing hashsum_to_variant map, stored in
+    hashsum.db, the journal events being the added [hashsum, variant].
     """
 
     db_cache = {}
 
     def __init__(self, atos_config):
-        self.db_file = os.path.join(
-            atos_config, "hashsum.db")
-        # create db file if not already existing
-        if not os.path.exists(self.db_file):
-            json.dump({}, process.open_locked(self.db_file, 'w'))
-        self.hashsums = {}
-        # db still not created in dryrun mode
-        if os.path.exists(self.db_file):  # pragma: branch_always
-            self.hashsums = json.load(
-                process.open_locked(self.db_file))
+        atos_json_journal.__init__(
+            self, os.path.join(atos_config, "hashsum.db"))
 
     def add_hashsum(self, hashsum, variant):
         if not hashsum: return  # pragma: uncovered
-        variant_hashsums = self.hashsums.setdefault(hashsum, [])
-        if variant in variant_hashsums:
+        if variant in self.variants.get(hashsum, ()):
             return
-        self.hashsums[hashsum].append(variant)
-        with process.open_locked(self.db_file, 'w') as db_file:
-            json.dump(self.hashsums, db_file, sort_keys=True, indent=4)
+        self._add([[hashsum, variant]])
 
     def get_variants(self, hashsum):
+        # variants may have been added by other processes
+        self.refresh()
         return self.hashsums.get(hashsum, [])
 
+    def _empty(self):
+        return {}
+
+    def _reset(self, data):
+        # {hashsum: set(variants)} index of variants
+        self.hashsums = data
+        self.variants = dict(map(
+                lambda (k, v): (k, set(v)), self.hashsums.items()))
+
+    def _snapshot(self):
+        return self.hashsums
+
+    def _apply(self, events):
+        for (hashsum, variant) in events:
+            variants = self.variants.setdefault(hashsum, set())
+            if variant in variants: continue
+            variants.add(variant)
+            self.hashsums.setdefault(hashsum, []).append(variant)
+
     @staticmethod
     def hashsum_db(atos_config):
         db = atos_buildhash_db.db_cache.get(atos_config, None)
@@ -1720,8 +1720,7 @@ class gen_flags_pruning(config_generator):
 
     def ref_result(self):
         db = atos_lib.atos_db.db(self.configuration_path)
-        ref_results = atos_lib.merge_results(
-            atos_lib.results_filter(db.get_results(), {'variant': 'REF'}))
+        ref_results = db.get_merged_results({'variant': 'REF'})
         assert ref_results and len(ref_results) == 1
         return ref_results[0].time, ref_results[0].size
 
@@ -2459,11 +2458,9 @@ def get_run_tradeoffs(
 def get_run_results(matches, configuration_path, **kwargs):
     multiprocess.wait_for_results(matches)
     db = atos_lib.atos_db.db(configuration_path)
-    ref_results = atos_lib.merge_results(
-        atos_lib.results_filter(db.get_results(), {'variant': 'REF'}))
+    ref_results = db.get_merged_results({'variant': 'REF'})
     assert ref_results and len(ref_results) == 1
-    variant_results = atos_lib.merge_results(
-        atos_lib.results_filter_cookies(db.get_results(), matches)) or []
+    variant_results = db.get_merged_cookies_results(matches) or []
     map(lambda x: x.compute_speedup(ref_results[0]), variant_results)
     return variant_results
 
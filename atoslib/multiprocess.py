@@ -19,12 +19,16 @@
 
 import os, sys, atexit, glob
 import threading
+import multiprocessing
+import time
+import itertools
 import traceback
 
 import globals
 import atos_lib
 import process
 import logger
+import progress
 
 def setup(kwargs):
     """
@@ -48,9 +52,9 @@ def wait_for_results(cookies):
     """
     Wait for results associated to given cookies.
     """
-    for cookie in cookies:
-        cookie_threads = mp.opt_thread_map.get(cookie, [])
-        for thr in cookie_threads: thr.join()
+    mp.wait_cookies(cookies)
+    # results of ended runs may still be in the write-behind queue
+    atos_lib.atos_db_writer.flush_results()
 
 class mp():
 
@@ -59,33 +63,50 @@ class mp():
     reloc_enabled = False
     keep_reloc_dir = False
 
-    # cookie_to_thread map {run_cookies: [opt_thread]}
+    # strategy for cloning the relocated build dir of multiple runs
+    # (see process.commands.clonetree)
+    reloc_clone = 'reflink'
+
+    # cookie_to_jobs map {run_cookie: number of unfinished atos_opt jobs}
     # used for waiting for results associated to given config cookies
-    opt_thread_map = {}
+    cookie_jobs = {}
+
+    # optjob_to_runs map {job_id: number of unfinished run jobs}
+    # used for waiting for run executions before ending an atos_opt job
+    job_runs = {}
+
+    # condition notified on atos_opt/run jobs end, guarding the maps
+    # above, from which entries are removed when their count drops to 0
+    jobs_cond = threading.Condition()
 
-    # jobid_to_optthread map {job_id: opt_thread}
-    # used for waiting for the end of a specific execution
-    job_thread_map = {}
+    # configopts_to_optjob map {(opt,fdo,lto): opt_job}, last atos_opt
+    # job of each config, dependency of the next one for avoiding
+    # fdo_profile_path overwrites and for giving reusing opportunity
+    cfg_job_map = {}
+    cfg_job_map_lock = threading.Lock()
 
-    # optthread_to_runthread map {opt_thread -> [run_thread]}
-    # used for waiting for run executions before ending an atos_opt thread
-    run_thread_map = {}
+    # scheduler of the opt/build/run jobs, limiting the number of
+    # simultaneous jobs of each kind
+    scheduler = None
 
-    # configopts_to_optthread map {(opt,fdo,lto): [opt_thread]}
-    # used for waiting for similar runs, for avoiding fdo_profile_path
-    # overwrites and for giving reusing opportunity
-    cfg_thread_map = {}
-    cfg_thread_map_lock = threading.Lock()
+    # build/run time estimations used for job priorities
+    estimates = None
 
-    # pools used for limiting number of simultaneous build/run jobs
-    build_pool = None
-    run_pool = None
-    opt_pool = None
+    # observed durations of the build/run jobs, {(kind, variant): time}
+    # and {kind: [total time, count]}, refining the above estimations
+    durations = {}
+    kind_durations = {}
+    durations_lock = threading.Lock()
 
     # pool size used for time estimation - resized in mp.setup
     build_pool_size = 1
     run_pool_size = 1
 
+    # cpu lists of the run slots [run_slot_cpus] and of the builds,
+    # None if no cpu affinity is set - computed in mp.setup
+    run_cpus = None
+    build_cpus = None
+
     @staticmethod
     def setup(kwargs):
         """
@@ -117,20 +138,118 @@ class mp():
             int(os.getenv("ATOS_RELOC", "1")))
         mp.keep_reloc_dir = bool(
             int(os.getenv("ATOS_KEEP_RELOC", "0")))
+        mp.reloc_clone = (
+            os.getenv("ATOS_RELOC_CLONE")
+            or atos_lib.get_config_value(
+                configuration_path, 'default_values.reloc_clone', '')
+            or 'reflink')
+        if mp.reloc_clone not in ['copy', 'reflink', 'link']:
+            logger.error("invalid reloc clone strategy '%s', must be one"
+                         " of copy, reflink or link" % mp.reloc_clone,
+                         exit_status=1)
         opt_pool_size = (
             int(os.getenv("ATOS_OPT_JOBS", "0"))
             or (mp.build_pool_size + mp.run_pool_size + 2))
 
-        if opt_pool_size > 0: mp.opt_pool = (
-            threading.BoundedSemaphore(value=opt_pool_size))
-        if mp.build_pool_size > 0: mp.build_pool = (
-            SemaphoreSlot(value=mp.build_pool_size))
-        if mp.run_pool_size > 0: mp.run_pool = (
-            SemaphoreSlot(value=mp.run_pool_size))
+        mp.scheduler = scheduler({
+                'opt': opt_pool_size, 'build': mp.build_pool_size,
+                'run': mp.run_pool_size})
+        mp.estimates = progress.estimated_times(configuration_path)
+
+        # dedicated cpus for the run slots, builds on the other ones
+        mp.run_cpus, mp.build_cpus = cpu_layout(
+            os.getenv("ATOS_RUN_CPUS")
+            or atos_lib.get_config_value(
+                configuration_path, 'default_values.run_cpus', ''),
+            os.getenv("ATOS_BUILD_CPUS")
+            or atos_lib.get_config_value(
+                configuration_path, 'default_values.build_cpus', ''),
+            mp.run_pool_size)
+
+    @staticmethod
+    def job_variant(args):
+        """ Return the variant id of a build/run job. """
+        return atos_lib.variant_id(
+            vars(args).get('options', None), vars(args).get('gopts', None),
+            vars(args).get('uopts', None))
+
+    @staticmethod
+    def record_time(kind, variant, elapsed):
+        """ Record the duration of a successful build/run job. """
+        with mp.durations_lock:
+            mp.durations[(kind, variant)] = elapsed
+            total = mp.kind_durations.setdefault(kind, [0.0, 0])
+            total[0] += elapsed
+            total[1] += 1
+
+    @staticmethod
+    def expected_time(kind, args):
+        """
+        Return the expected duration of a job, from the last duration of
+        a job of the same variant, or else from the mean duration of the
+        jobs of the same kind, or else from the build/run time estimation.
+        None if not yet estimated.
+        """
+        def variant_time(kind, variant):
+            with mp.durations_lock:
+                if (kind, variant) in mp.durations:
+                    return mp.durations[(kind, variant)]
+                total, count = mp.kind_durations.get(kind, (0.0, 0))
+            if count: return total / count
+            return mp.estimates.get_estimated_time(kind)
+        if kind in ['build', 'run']:
+            return variant_time(kind, mp.job_variant(args))
+        # atos_opt job: profile-gen build and run if fdo, build and runs
+        fdo = bool(vars(args).get('fdo', False))
+        nbruns = vars(args).get('nbruns', None) or 1
+        options = args.options or ''
+        uopts = args.uopts or (options if fdo else None)
+        variant = atos_lib.variant_id(options, None, uopts)
+        times = [variant_time('build', variant)] + [
+            variant_time('run', variant)] * nbruns
+        if fdo:
+            gen_variant = atos_lib.variant_id(options, uopts, None)
+            times += [variant_time('build', gen_variant),
+                      variant_time('run', gen_variant)]
+        if None in times: return None
+        return sum(times)
 
     @staticmethod
     def new_job_id(): return atos_lib.new_cookie()
 
+    @staticmethod
+    def register(counts, keys):
+        """ Increment the unfinished jobs count of the given keys. """
+        with mp.jobs_cond:
+            for key in keys: counts[key] = counts.get(key, 0) + 1
+
+    @staticmethod
+    def unregister(counts, keys):
+        """ Decrement the unfinished jobs count of the given keys. """
+        with mp.jobs_cond:
+            for key in keys:
+                counts[key] -= 1
+                if not counts[key]: del counts[key]
+            mp.jobs_cond.notify_all()
+
+    @staticmethod
+    def wait_jobs(counts, keys):
+        """ Wait until no job is left for the given keys. """
+        with mp.jobs_cond:
+            while any(map(lambda key: key in counts, keys)):
+                # timeout for remaining interruptible (Ctrl-C)
+                mp.jobs_cond.wait(1.0)
+
+    @staticmethod
+    def wait_cookies(cookies):
+        """ Wait for the end of the atos_opt jobs of given cookies. """
+        mp.wait_jobs(mp.cookie_jobs, cookies)
+
+    @staticmethod
+    def wait_runs(job_id):
+        """ Wait for the end of the run jobs of given atos_opt job. """
+        mp.wait_jobs(mp.job_runs, [job_id])
+
     @staticmethod
     def execute(func, *args, **kwargs):
         # see also utils/execute
@@ -179,49 +298,63 @@ class mp():
         this atos_opt run results.
         Wait until thread termination if profiling (oprof/perf) config.
         """
-        def atos_opt_wrapper(func, args):
-            # wait until similar configs run end
-            wait_for_similar_jobs(args)
-            # call the run_atos_opt function
-            status = mp.execute(func, args)
-            # wait for all pending runs before exit
-            map(lambda thr: thr.join(), mp.run_thread_map.get(args.job_id, []))
-            # call given callback if any (progress update, for ex.)
-            map(lambda x: x(), args.__dict__.get('opt_callbacks', None) or [])
-            # remove the reloc_exec directory
-            if args.reloc_dir and not mp.keep_reloc_dir:
-                process.commands.rmtree(args.reloc_dir)
-            # release the opt slot
-            mp.opt_pool and mp.opt_pool.release()
+        def atos_opt_wrapper(func, args, opt_job):
+            status = None
+            try:
+                # wait until similar configs run end
+                mp.scheduler.wait(opt_job.deps)
+                # call the run_atos_opt function
+                status = mp.execute(func, args)
+                # wait for all pending runs before exit
+                mp.wait_runs(args.job_id)
+                # make run results visible to threads joining this one
+                atos_lib.atos_db_writer.flush_results()
+                # call given callback if any (progress update, for ex.)
+                map(lambda x: x(),
+                    args.__dict__.get('opt_callbacks', None) or [])
+                # remove the reloc_exec directory
+                if args.reloc_dir and not mp.keep_reloc_dir:
+                    process.commands.rmtree(args.reloc_dir)
+            finally:
+                # release the opt slot, similar configs can start
+                mp.scheduler.end(opt_job, failed=status != 0)
             return status
 
-        def wait_for_similar_jobs(args):
-            # consider fdo and fdo+lto as the same config
-            config = (args.options, args.fdo, args.lto and not args.fdo)
-            # register current opt-thread in cfg-thread map
-            mp.cfg_thread_map_lock.acquire()
-            mp.cfg_thread_map.setdefault(config, []).append(
-                mp.job_thread_map[args.job_id])
-            cfg_threads = mp.cfg_thread_map[config][:-1]
-            mp.cfg_thread_map_lock.release()
-            # wait for fdo_thread termination
-            map(lambda thr: thr.join(), cfg_threads)
+        def similar_jobs(config, opt_job):
+            # opt job depends on the last job of the same config
+            with mp.cfg_job_map_lock:
+                deps = filter(None, [mp.cfg_job_map.get(config, None)])
+                mp.cfg_job_map[config] = opt_job
+            return deps
+
+        def opt_job_done(config, opt_job, cookies):
+            # forget the config last job if no other job was queued since
+            with mp.cfg_job_map_lock:
+                if mp.cfg_job_map.get(config, None) is opt_job:
+                    del mp.cfg_job_map[config]
+            mp.unregister(mp.cookie_jobs, cookies)
 
         # unique id for this atos-opt job
         job_id = mp.new_job_id()
         # wait for a free slot in the opt pool
-        mp.opt_pool and mp.opt_pool.acquire()
+        # fdo jobs first, as their chain of jobs is longer
+        opt_job = job('opt', priority=int(not vars(args).get('fdo', False)),
+                      expected=mp.expected_time('opt', args))
+        # consider fdo and fdo+lto as the same config
+        config = (args.options, args.fdo, args.lto and not args.fdo)
+        opt_job.deps = similar_jobs(config, opt_job)
+        mp.scheduler.start(opt_job, wait_deps=False)
         # relocated execution directory
         args = atos_lib.namespace(
             args, reloc_dir=mp.reloc_exec_dir(args, job_id), job_id=job_id)
         # create a thread for the atos-opt execution
         opt_thread = IntThread(
-            target=atos_opt_wrapper, args=(func, args))
-        # register it in the thread map {run_cookies: [opt_thread]}
-        for cookie in args.cookies or [None]: mp.opt_thread_map.setdefault(
-            cookie, []).append(opt_thread)
-        # register it in the jobs map {job_id: opt_thread}
-        mp.job_thread_map.update({job_id: opt_thread})
+            target=atos_opt_wrapper, args=(func, args, opt_job))
+        # register it in the cookie map {run_cookie: unfinished jobs}
+        cookies = args.cookies or [None]
+        mp.register(mp.cookie_jobs, cookies)
+        opt_thread.add_done_callback(
+            lambda thr: opt_job_done(config, opt_job, cookies))
         # thread's activity can now be started
         opt_thread.start()
         # wait for the results in case of profiling (oprofile/perf) run
@@ -240,17 +373,30 @@ class mp():
         from atos_opt/atos-run.
         """
         def atos_one_run_wrapper(func, args):
-            # wait for a free slot in the run pool
-            slot = mp.run_pool and mp.run_pool.acquire()
-            # handle reloc_exec run dir
-            args = atos_lib.namespace(args, reloc_dir=reloc_run_dir(args))
-            # call the run_atos_one_run function
-            status = mp.execute(func, atos_lib.namespace(args, run_slot=slot))
-            # remove the run directory - unless profile-gen run
-            if args.reloc_dir and not mp.keep_reloc_dir and args.gopts is None:
-                process.commands.rmtree(args.reloc_dir)
-            # release the run slot
-            mp.run_pool and mp.run_pool.release(slot)
+            # wait for a free slot in the run pool, profile-gen runs
+            # first as their atos_opt job is waiting for them
+            run_job = job('run', priority=int(args.gopts is None),
+                          expected=mp.expected_time('run', args))
+            slot = mp.scheduler.start(run_job)
+            status = None
+            try:
+                # handle reloc_exec run dir
+                args = atos_lib.namespace(
+                    args, reloc_dir=reloc_run_dir(args))
+                # call the run_atos_one_run function
+                start = time.time()
+                status = mp.execute(func, atos_lib.namespace(
+                        args, run_slot=slot,
+                        run_cpus=mp.run_cpus and mp.run_cpus[slot]))
+                if not status: mp.record_time(
+                    'run', mp.job_variant(args), time.time() - start)
+                # remove the run directory - unless profile-gen run
+                if (args.reloc_dir and not mp.keep_reloc_dir and
+                    args.gopts is None):
+                    process.commands.rmtree(args.reloc_dir)
+            finally:
+                # release the run slot
+                mp.scheduler.end(run_job, failed=status != 0)
             return status
 
         def reloc_run_dir(args):
@@ -261,18 +407,22 @@ class mp():
             if not run_number: return args.reloc_dir
             # handle multiple run case
             run_cwd = args.reloc_dir + '-' + str(run_number)
-            # copy build_reloc_dir if existing
+            # clone build_reloc_dir if existing
             if os.path.exists(args.reloc_dir):  # pragma: branch_always
                 process.commands.rmtree(run_cwd)
-                # avoid to open in write mode files that will be executed
-                process.system(["/bin/cp", "-fr", args.reloc_dir, run_cwd])
+                copied = process.commands.clonetree(
+                    args.reloc_dir, run_cwd, mp.reloc_clone)
+                logger.debug("run dir %s: %d bytes copied" % (
+                        run_cwd, copied))
             return run_cwd
 
         # create a thread for the atos-one-run execution
         run_thread = IntThread(
             target=atos_one_run_wrapper, args=(func, args))
-        # register it in the run_thread map {opt_thread -> [run_thread]}
-        mp.run_thread_map.setdefault(args.job_id, []).append(run_thread)
+        # register it in the run map {job_id: unfinished runs}
+        mp.register(mp.job_runs, [args.job_id])
+        run_thread.add_done_callback(
+            lambda thr: mp.unregister(mp.job_runs, [args.job_id]))
         # start the run thread activity
         run_thread.start()
         # wait for the results in case of profiling (fdo) run
@@ -294,21 +444,34 @@ class mp():
         status = mp.execute(func, atos_lib.namespace(
                 args, reloc_dir=reloc_dir, job_id=job_id))
         # wait for all pending runs before exit
-        map(lambda thr: thr.join(), mp.run_thread_map.get(job_id, []))
+        mp.wait_runs(job_id)
+        atos_lib.atos_db_writer.flush_results()
         return status
 
     @staticmethod
     def start_atos_build(func, args):
         """
         Launch an atos_build execution.
-        Handle build-jobs limit by using build_pool semaphore.
+        Handle build-jobs limit by using the build slots of the scheduler.
         """
-        # wait for a free slot in the build pool
-        slot = mp.build_pool and mp.build_pool.acquire()
-        # call the run_atos_build function
-        status = mp.execute(func, atos_lib.namespace(args, build_slot=slot))
-        # release the build slot
-        mp.build_pool and mp.build_pool.release(slot)
+        # wait for a free slot in the build pool, profile-gen and
+        # profile-use builds first for unblocking fdo chains
+        fdo_chain = not (vars(args).get('gopts', None) is None and
+                         vars(args).get('uopts', None) is None)
+        build_job = job('build', priority=int(not fdo_chain),
+                        expected=mp.expected_time('build', args))
+        slot = mp.scheduler.start(build_job)
+        status = None
+        try:
+            # call the run_atos_build function
+            start = time.time()
+            status = mp.execute(func, atos_lib.namespace(
+                    args, build_slot=slot, build_cpus=mp.build_cpus))
+            if not status: mp.record_time(
+                'build', mp.job_variant(args), time.time() - start)
+        finally:
+            # release the build slot, even on failure
+            mp.scheduler.end(build_job, failed=status != 0)
         return status
 
     @staticmethod
@@ -337,45 +500,189 @@ class mp():
 
         return tool_func(tool_args)
 
-class SemaphoreSlot(threading._Semaphore):
+def cpu_list(cpus):
     """
-    Semaphore managing a slots pool.
+    Return the sorted list of cpus numbers of a cpu list string
+    (taskset format, for instance "0-3,6").
     """
-    def __init__(self, value=1):
-        threading._Semaphore.__init__(self, value)
-        self._slots_nb = value
-        self._slots_lock = threading.Lock()
-        self._slots = [True] * value
-
-    def acquire(self):
-        threading._Semaphore.acquire(self, blocking=1)
-        self._slots_lock.acquire()
-        assert any(self._slots), "unexpected slot unavailability"
-        slot = self._slots.index(True)
-        self._slots[slot] = False
-        self._slots_lock.release()
-        return slot
-
-    def release(self, slot):
-        assert 0 <= slot < self._slots_nb, "unexpected slot number"
-        assert not self._slots[slot], "unexpected slot release"
-        self._slots[slot] = True
-        threading._Semaphore.release(self)
+    numbers = set()
+    for item in filter(bool, cpus.split(',')):
+        first, _, last = item.partition('-')
+        numbers.update(range(int(first), int(last or first) + 1))
+    return sorted(numbers)
+
+def allowed_cpus():
+    """
+    Return the sorted list of the cpus the process is allowed to run on
+    (affinity mask inherited from taskset, cgroups cpusets, ...).
+    """
+    if hasattr(os, 'sched_getaffinity'):  # pragma: uncovered
+        return sorted(os.sched_getaffinity(0))
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Cpus_allowed_list:'):
+                    return cpu_list(line.split(':', 1)[1].strip())
+    except IOError:  # pragma: uncovered
+        pass
+    return range(multiprocessing.cpu_count())  # pragma: uncovered
+
+def cpu_layout(run_cpus, build_cpus, run_slots, cpus=None):
+    """
+    Return the cpu lists of the run slots and of the builds.
+    run_cpus is either empty (no cpu affinity), "auto" (one dedicated
+    cpu for each run slot, the last allowed ones) or the cpu lists of
+    the run slots separated by ':' (for instance "2-3:4-5").
+    build_cpus defaults to the allowed cpus that are not dedicated to
+    runs. cpus defaults to the cpus allowed for the process.
+    """
+    if not run_cpus and not build_cpus: return None, None
+    cpus = cpus or allowed_cpus()
+    if run_cpus == 'auto':
+        if len(cpus) <= run_slots:
+            logger.warning(
+                "not enough cpus for dedicated run cpus (%d cpus for %d"
+                " run jobs), cpu affinity disabled" % (
+                    len(cpus), run_slots))
+            return None, None
+        run_cpus = ':'.join(map(
+                lambda slot: str(cpus[-1 - slot]), range(run_slots)))
+    try:
+        run_sets = map(cpu_list, filter(bool, (run_cpus or '').split(':')))
+        build_set = cpu_list(build_cpus or '')
+    except ValueError:
+        logger.error("invalid cpu lists: run_cpus='%s' build_cpus='%s'" % (
+                run_cpus or '', build_cpus or ''), exit_status=1)
+    if run_sets and len(run_sets) < run_slots:
+        logger.error("%d run cpu lists given for %d run jobs" % (
+                len(run_sets), run_slots), exit_status=1)
+    used = sum(map(len, run_sets), 0)
+    if used != len(set(sum(run_sets, []))):
+        logger.error("run cpu lists must be disjoint", exit_status=1)
+    build_set = build_set or filter(
+        lambda cpu: cpu not in sum(run_sets, []), cpus)
+    if not build_set:
+        logger.error("no cpu left for builds", exit_status=1)
+    if not process.commands.which("taskset"):
+        logger.error("taskset not found, needed for cpu affinity",
+                     exit_status=1)
+
+    def cpu_string(cpus): return ",".join(map(str, cpus))
+    return (map(cpu_string, run_sets) or None), cpu_string(build_set)
+
+class job():
+    """
+    Node of the jobs graph: an atos_opt, build or run job, started once
+    the jobs it depends on are done, holding a slot until its end.
+    """
+    counter = itertools.count()
+
+    def __init__(self, kind, priority=0, expected=None, deps=None):
+        self.kind = kind
+        self.priority = priority
+        self.expected = expected
+        self.deps = deps or []
+        self.wait_deps = True
+        self.slot = None
+        self.done = False
+        self.failed = False
+        # submission order, used between jobs of same priority
+        self.order = job.counter.next()
+
+    def key(self):
+        # lowest priority value first, then shortest expected job
+        return (self.priority, self.expected or 0, self.order)
+
+class scheduler():
+    """
+    Jobs scheduler managing a pool of slots for each kind of jobs.
+    Slots are given to the ready jobs (all dependencies done) in the
+    order of their key, instead of their arrival order, so that slow
+    fdo chains do not delay the other jobs more than needed.
+    """
+    def __init__(self, pools):
+        self.cond = threading.Condition()
+        # {kind: [slot is free]}
+        self.slots = dict(map(
+                lambda (kind, size): (kind, [True] * max(size, 1)),
+                pools.items()))
+        self.waiting = []
+
+    def start(self, job, wait_deps=True):
+        """
+        Wait until the job can start and return its slot number.
+        If wait_deps is False, dependencies are waited by the job.
+        """
+        with self.cond:
+            job.wait_deps = wait_deps
+            self.waiting.append(job)
+            # a job may start while another is woken up
+            self.cond.notify_all()
+            while not self._startable(job):
+                # timeout for remaining interruptible (Ctrl-C)
+                self.cond.wait(1.0)
+            self.waiting.remove(job)
+            job.slot = self.slots[job.kind].index(True)
+            self.slots[job.kind][job.slot] = False
+            return job.slot
+
+    def end(self, job, failed=False):
+        """
+        Release the job slot, dependent jobs may start.
+        Must be called even if the job failed, with failed set.
+        """
+        with self.cond:
+            self.slots[job.kind][job.slot] = True
+            job.done = True
+            job.failed = failed
+            # do not keep the chain of done jobs alive
+            job.deps = []
+            self.cond.notify_all()
+
+    def wait(self, jobs):
+        """ Wait until the given jobs are done. """
+        with self.cond:
+            while not all(map(lambda x: x.done, jobs)):
+                self.cond.wait(1.0)
+
+    def _ready(self, job):
+        return not job.wait_deps or all(map(lambda x: x.done, job.deps))
+
+    def _startable(self, job):
+        if not self._ready(job): return False
+        free = self.slots[job.kind].count(True)
+        if not free: return False
+        # the job is one of the first ready jobs of its kind
+        ready = sorted(map(lambda x: x.key(), filter(
+                    lambda x: x.kind == job.kind and self._ready(x),
+                    self.waiting)))
+        return job.key() in ready[:free]
 
 class IntThread(threading.Thread):
     """
-    Thread with interruptible join and return value.
+    Thread with interruptible join, return value and completion callbacks.
     """
     # return value idea from stackoverflow.com/questions/6893968
     def __init__(self, group=None, target=None, name=None, args=(), kwargs={}):
         threading.Thread.__init__(
             self, group, target, name, args, kwargs)
         self._return = None
+        self._callbacks = []
+
+    def add_done_callback(self, func):
+        """ Call func(thread) at the end of the thread activity. """
+        self._callbacks.append(func)
 
     def run(self):
         if self._Thread__target is None: return  # pragma: uncovered
-        self._return = self._Thread__target(
-            *self._Thread__args, **self._Thread__kwargs)
+        try:
+            self._return = self._Thread__target(
+                *self._Thread__args, **self._Thread__kwargs)
+        finally:
+            map(lambda func: func(self), self._callbacks)
+            # release target arguments and callbacks references
+            del self._Thread__target, self._Thread__args
+            del self._Thread__kwargs, self._callbacks
 
     def join(self, timeout=None):
         # joining with a timeout, even with big value, can
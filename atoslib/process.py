@@ -266,11 +266,21 @@ def open_locked(filename, mode='r', timeout=None):
             return outf
         try:
             fcntl.flock(outf, fcntl.LOCK_EX | fcntl.LOCK_NB)
-            return outf
-        except: outf.close()
+            # file may have been replaced while waiting for the lock
+            # (atos lib compact): lock the new one
+            if _same_file(outf, filename): return outf
+        except: pass
+        outf.close()
         time.sleep(0.2)
         delay += 0.2
 
+def _same_file(openf, filename):
+    try: file_stat = os.stat(filename)
+    except OSError: return False
+    open_stat = os.fstat(openf.fileno())
+    return ((open_stat.st_dev, open_stat.st_ino) ==
+            (file_stat.st_dev, file_stat.st_ino))
+
 def _open(name, *args):
     modes = args[0] if args else "r"
     if _dryrun and (set(modes) & set(["w", "a", "+"])):
@@ -290,6 +300,58 @@ def _open(name, *args):
         openf = _real_open(name, *args)
     return openf
 
+# linux values, missing from python 2 os/fcntl modules
+_O_CLOEXEC = getattr(os, 'O_CLOEXEC', 02000000)
+_FICLONE = 0x40049409
+
+# devices on which reflinks are not supported
+_no_reflink_devs = set()
+
+def _clone_file(src, src_stat, dst, strategy):
+    """
+    Clone the regular file src into dst with the given strategy and
+    return the method used ('link', 'reflink' or 'copy') and the number
+    of bytes actually copied.
+    """
+    if strategy == 'link' and not src_stat.st_mode & 0222:
+        try:
+            os.link(src, dst)
+            return 'link', 0
+        except OSError, e:
+            if e.errno not in [errno.EXDEV, errno.EMLINK, errno.EPERM]:
+                raise
+    # close-on-exec descriptors, as a child process inheriting a write
+    # descriptor would prevent the execution of the cloned file (ETXTBSY)
+    src_fd = os.open(src, os.O_RDONLY | _O_CLOEXEC)
+    try:
+        dst_fd = os.open(
+            dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_CLOEXEC,
+            stat.S_IMODE(src_stat.st_mode))
+        try:
+            if strategy != 'copy' and src_stat.st_dev not in _no_reflink_devs:
+                try:
+                    fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+                    return 'reflink', 0
+                except IOError, e:
+                    if e.errno not in [
+                        errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                        errno.EINVAL, errno.ENOSYS]:  # pragma: uncovered
+                        raise
+                    _no_reflink_devs.add(src_stat.st_dev)
+            copied = 0
+            while True:
+                data = os.read(src_fd, 1 << 20)
+                if not data: break
+                while data:
+                    written = os.write(dst_fd, data)
+                    data = data[written:]
+                    copied += written
+            return 'copy', copied
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
 def debug(msg, *args, **kwargs):
     """ Log a process debug message on the ATOS logger. """
     logging.debug(msg, *args, **kwargs)
@@ -367,6 +429,53 @@ class commands():
         if _dryrun: return
         shutil.copytree(src, dst)
 
+    @staticmethod
+    def clonetree(src, dst, strategy='reflink'):
+        """
+        Recursively clone the src directory into dst and return the
+        number of bytes actually copied. Regular files are cloned with
+        the given strategy:
+        - 'copy': plain copy,
+        - 'reflink': copy-on-write clone if supported by the filesystem,
+          plain copy otherwise,
+        - 'link': hard link for read-only files, as 'reflink' for others.
+        As with 'cp -r', symbolic links are recreated, not followed.
+        """
+        logging.debug('cp -r %s %s # %s' % (src, dst, strategy))
+        if _dryrun: return 0
+        assert strategy in ['copy', 'reflink', 'link']
+        methods = {'link': 0, 'reflink': 0, 'copy': 0}
+        copied, dirs = 0, []
+        os.mkdir(dst)
+        dirs.append((src, dst))
+        for root, dirnames, filenames in os.walk(src):
+            dst_root = os.path.join(dst, os.path.relpath(root, src))
+            for name in dirnames + filenames:
+                src_path = os.path.join(root, name)
+                dst_path = os.path.join(dst_root, name)
+                src_stat = os.lstat(src_path)
+                if stat.S_ISLNK(src_stat.st_mode):
+                    os.symlink(os.readlink(src_path), dst_path)
+                elif stat.S_ISDIR(src_stat.st_mode):
+                    os.mkdir(dst_path)
+                    dirs.append((src_path, dst_path))
+                elif stat.S_ISREG(src_stat.st_mode):
+                    method, size = _clone_file(
+                        src_path, src_stat, dst_path, strategy)
+                    methods[method] += 1
+                    copied += size
+                else:  # pragma: uncovered
+                    logging.debug('cp: skipping special file ' + src_path)
+        # directory modes are set last, for read-only directories
+        for src_path, dst_path in reversed(dirs):
+            shutil.copymode(src_path, dst_path)
+        logging.debug(
+            'cp -r %s %s: %d linked, %d reflinked, %d copied files'
+            ', %d bytes copied' % (
+                src, dst, methods['link'], methods['reflink'],
+                methods['copy'], copied))
+        return copied
+
     @staticmethod
     def link_or_copyfile(src, dst):
         logging.debug('ln -f %s %s' % (src, dst))
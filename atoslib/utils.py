@@ -19,6 +19,7 @@
 
 import sys, os
 import re
+import itertools
 import traceback
 import json
 import tempfile
@@ -41,6 +42,9 @@ from atoslib.recipes import RecipeStorage, RecipeManager
 
 _at_toplevel = None
 
+# {tool: (default values, actions)}, see tool_actions()
+_tool_actions = {}
+
 def invoque(tool, args, **kwargs):
     """
     Dispatcher that invoques the given tool and returns.
@@ -94,25 +98,34 @@ def invoque(tool, args, **kwargs):
     return run_tool_func(
         functions[tool], atos_tool_args(tool, args, **kwargs))
 
+def tool_actions(tool):
+    """
+    Returns the default values and the actions of the tool arguments
+    indexed by destination. Computed once per tool, as building the
+    tool parser is costly and done at each tool invocation.
+    """
+    if tool not in _tool_actions:
+        actions = filter(lambda x: x.dest is not None,
+                         arguments.parser(tool)._actions)
+        _tool_actions[tool] = (
+            dict(map(lambda x: (x.dest, x.default), actions)),
+            dict(map(lambda x: (x.dest, x), actions)))
+    return _tool_actions[tool]
+
 def atos_tool_args(tool, args, **kwargs):
     """ Returns the args arguments modified by kwargs. """
-    tool_args = arguments.argparse.Namespace()
-    for action in arguments.parser(tool)._actions:
-        if action.dest is None: continue  # pragma: uncovered (impossible?)
-        tool_args.__dict__[action.dest] = action.default
+    tool_args = arguments.argparse.Namespace(**tool_actions(tool)[0])
     tool_args.__dict__.update(vars(args))
     tool_args.__dict__.update(kwargs)
     return tool_args
 
 def atos_tool_cmdline(tool, args, **kwargs):
-    dest_to_opt = dict(map(
-            lambda x: (x.dest, x),
-            arguments.parser(tool)._actions))
+    dest_to_opt = tool_actions(tool)[1]
     atos_bin = os.path.join(
         os.path.abspath(os.path.dirname(sys.argv[0])), "atos")
     arg_list, remainder = [atos_bin, tool[len("atos-"):]], []
     for key, value in atos_tool_args(tool, args, **kwargs).__dict__.items():
-        if key == 'dryrun' or key not in dest_to_opt.keys():
+        if key == 'dryrun' or key not in dest_to_opt:
             continue
         default = dest_to_opt[key].default
         if value == default: continue
@@ -654,7 +667,8 @@ def run_atos_build_local(args):
         progress_type="build", variant_id=variant,
         config_path=args.configuration_path)
     status, output = process.system(
-        atos_lib.timeout_command() + atos_lib.env_command(driver_env)
+        atos_lib.affinity_command(args.__dict__.get('build_cpus', None))
+        + atos_lib.timeout_command() + atos_lib.env_command(driver_env)
         + command, get_output=True, output_stderr=True, keep_fds=debug_fd)
     build_progress.end(status=status)
     os.close(debug_fd)
@@ -918,6 +932,14 @@ def run_atos_init(args):
         atos_lib.json_config(config_file).add_value(
             "default_values.run_jobs", str(args.run_jobs))
 
+    if args.run_cpus is not None:
+        atos_lib.json_config(config_file).add_value(
+            "default_values.run_cpus", args.run_cpus)
+
+    if args.build_cpus is not None:
+        atos_lib.json_config(config_file).add_value(
+            "default_values.build_cpus", args.build_cpus)
+
     if args.remote_build_script or args.remote_exec_script:
         atos_lib.json_config(config_file).add_value(
             "default_values.remote_build", str(1))
@@ -1017,25 +1039,39 @@ def run_atos_lib(args):
         elif args.type == 'json':
             db_file = os.path.join(args.configuration_path, 'results.json')
             db = atos_lib.atos_db_json(db_file)
-        elif args.type == 'pickle':  # pragma: branch_always
+        elif args.type == 'pickle':
             db_file = os.path.join(args.configuration_path, 'results.pkl')
             db = atos_lib.atos_db_pickle(db_file)
+        elif args.type == 'sqlite':
+            db_file = os.path.join(args.configuration_path, 'results.sqlite')
+            db = atos_lib.atos_db_sqlite(db_file)
+        elif args.type == 'binary':  # pragma: branch_always
+            db_file = os.path.join(args.configuration_path, 'results.bin')
+            db = atos_lib.atos_db_binary(db_file)
         else: assert 0  # pragma: unreachable
         if args.shared: process.commands.chmod(db_file, 0660)
+        if args.shared and args.type == 'binary':  # pragma: uncovered
+            process.commands.chmod(db.strings_file, 0660)
         info('created new database in "%s"' % db_file)
         return 0
 
     elif args.subcmd_lib == "query":
+        query = atos_lib.strtoquery(args.query)
         if args.configuration_path == '-':
-            results = atos_lib.results_filter(
-                atos_lib.atos_client_db.db_load(sys.stdin),
-                atos_lib.strtoquery(args.query))
+            results = atos_lib.atos_client_db.db_iter_load(sys.stdin)
+            if isinstance(query, str):
+                results = atos_lib.results_filter(list(results), query)
+            else:
+                results = itertools.ifilter(
+                    atos_lib.results_query(query), results)
         else:
-            client = atos_lib.atos_client_db(
-                atos_lib.atos_db.db(args.configuration_path))
-            results = client.query(atos_lib.strtoquery(args.query))
+            results = atos_lib.atos_db.db(
+                args.configuration_path).iter_results(query)
 
-        atos_lib.pprint_list(results, text=args.text)
+        if args.lines:
+            atos_lib.pprint_lines(results)
+        else:
+            atos_lib.pprint_list(list(results), text=args.text)
         return 0
 
     elif args.subcmd_lib == "speedups":
@@ -1059,20 +1095,32 @@ def run_atos_lib(args):
 
     elif args.subcmd_lib == "push":
         db = atos_lib.atos_db.db(args.configuration_path)
-        results = atos_lib.atos_client_db.db_query(
+        results = atos_lib.atos_client_db.db_iter_query(
             db, atos_lib.strtoquery(args.query),
             atos_lib.strtodict(args.replacement))
+        # incremental push: only results after the given watermark
+        try: results = atos_lib.results_watermark(results, args.since)
+        except ValueError, e:
+            error(str(e))
+            return 1
 
-        if args.remote_configuration_path == '-':
-            status, output = atos_lib.atos_client_db.db_dump(
+        skipped = 0
+        if args.remote_configuration_path == '-' and args.lines:
+            status, output = atos_lib.atos_client_db.db_dump_lines(
                 results, sys.stdout)
+        elif args.remote_configuration_path == '-':
+            status, output = atos_lib.atos_client_db.db_dump(
+                list(results), sys.stdout)
         else:
             other_db = atos_lib.atos_db.db(args.remote_configuration_path)
             status, output = atos_lib.atos_client_db.db_transfer(
-                other_db, results, args.force)
+                other_db, results, args.force, duplicates=args.duplicates)
+            if status: output, skipped = output
 
         if status:
             info('exported %d results' % (output))
+            if skipped: info('skipped %d duplicated results' % (skipped))
+            info('watermark: %s' % results.watermark())
             return 0
         else:  # pragma: uncovered (error)
             error(output)
@@ -1082,18 +1130,26 @@ def run_atos_lib(args):
         db = atos_lib.atos_db.db(args.configuration_path)
 
         if args.remote_configuration_path == '-':
-            results = atos_lib.atos_client_db.db_load(sys.stdin)
+            results = atos_lib.atos_client_db.db_iter_load(sys.stdin)
         else:
             other_db = atos_lib.atos_db.db(args.remote_configuration_path)
-            results = atos_lib.atos_client_db.db_query(
+            results = atos_lib.atos_client_db.db_iter_query(
                 other_db, atos_lib.strtoquery(args.query),
                 atos_lib.strtodict(args.replacement))
+        # incremental pull: only results after the given watermark
+        try: results = atos_lib.results_watermark(results, args.since)
+        except ValueError, e:
+            error(str(e))
+            return 1
 
         status, output = atos_lib.atos_client_db.db_transfer(
-            db, results, args.force)
+            db, results, args.force, duplicates=args.duplicates)
 
         if status:
-            info('imported %d results' % (output))
+            count, skipped = output
+            info('imported %d results' % (count))
+            if skipped: info('skipped %d duplicated results' % (skipped))
+            info('watermark: %s' % results.watermark())
             return 0
         else:  # pragma: uncovered (error)
             error(output)
@@ -1139,6 +1195,14 @@ def run_atos_lib(args):
 
         table = (args.mode != 'stdev') and [[''] + group_names] or []
 
+        # statistics on the runs of each variant
+        if args.mode == 'stdev':
+            all_statistics = dict(map(lambda target: (
+                        target, atos_lib.results_statistics(sum(map(
+                                lambda variant: all_results[target][variant]
+                                ._results[0]._results, variants), []))),
+                                      group_names))
+
         for variant in variants:
 
             table += [[variant]]
@@ -1159,17 +1223,12 @@ def run_atos_lib(args):
 
                 elif args.mode == 'stdev':
                     table += [[target]]
-                    results = map(
-                        lambda r: r.time,
-                        all_results[target][variant]._results[0]._results)
-                    avg_res, min_res, max_res = (
-                        atos_lib.average(results), min(results), max(results))
+                    avg_res, min_res, max_res, stdev_res = (
+                        all_statistics[target][variant])
                     max_avg_diff = max(avg_res - min_res, max_res - avg_res)
                     table[-1] += ['%.2f' % avg_res]
                     table[-1] += ['%.2f%%' % ((max_avg_diff / avg_res) * 100)]
-                    table[-1] += ['%.2f%%' % (
-                            (atos_lib.standard_deviation(results) / avg_res)
-                        * 100)]
+                    table[-1] += ['%.2f%%' % ((stdev_res / avg_res) * 100)]
 
                 else: assert 0  # pragma: unreachable
 
@@ -1178,6 +1237,21 @@ def run_atos_lib(args):
         atos_lib.pprint_table(table, reverse=args.reverse)
         return 0
 
+    elif args.subcmd_lib == "compact":
+        try:
+            nresults, nrows, nfailures = atos_lib.compact_db(
+                args.configuration_path, args.type, args.aggregate,
+                args.failures)
+        except RuntimeError, e:
+            error(str(e))
+            return 1
+        info('compacted %d results in %d rows' % (nresults, nrows))
+        if nfailures and args.failures != 'keep':
+            info('%s %d failed results' % (
+                    args.failures == 'drop' and 'dropped' or 'archived',
+                    nfailures))
+        return 0
+
     elif args.subcmd_lib == "add_result":  # pragma: uncovered
         result = atos_lib.strtodict(args.result)
 
@@ -1281,10 +1355,8 @@ def run_atos_opt(args):
         else:
             # reuse existing results for this variant
             db = atos_lib.atos_db.db(args.configuration_path)
-            results = atos_lib.merge_results(
-                atos_lib.results_filter(
-                    db.get_results(), {"variant": variant_id}),
-                merge_targets=False)
+            results = db.get_merged_results(
+                {"variant": variant_id}, merge_targets=False)
             if results:
                 atos_lib.reuse_run_result(
                     db, variant_id, options, uopts, args, results)
@@ -1553,13 +1625,10 @@ def run_atos_run(args):
     if reuse:
         # use results of another same-hash variant if exising
         db = atos_lib.atos_db.db(args.configuration_path)
-        results = atos_lib.merge_results(
-            atos_lib.results_filter(db.get_results(), {'hash': hashsum}))
+        results = db.get_merged_results({'hash': hashsum})
         if results:
-            results = atos_lib.merge_results(
-                atos_lib.results_filter(
-                    db.get_results(), {"variant": results[0].variant}),
-                merge_targets=False)
+            results = db.get_merged_results(
+                {"variant": results[0].variant}, merge_targets=False)
             atos_lib.reuse_run_result(
                 db, variant_id, args.options, args.uopts, args, results)
             message("Reusing run results for variant %s..." % variant_id)
@@ -1747,7 +1816,8 @@ def run_atos_one_run_local(args):
             progress_type="run", variant_id=variant,
             config_path=args.configuration_path)
         status, output = process.system(
-            atos_lib.timeout_command() + atos_lib.proot_reloc_command(args)
+            atos_lib.affinity_command(args.__dict__.get('run_cpus', None))
+            + atos_lib.timeout_command() + atos_lib.proot_reloc_command(args)
             + atos_lib.env_command(run_env)
             + process.cmdline2list(time_command) + run_script,
             get_output=True, output_stderr=True)
@@ -1807,8 +1877,10 @@ def run_atos_one_run_local(args):
             db = atos_lib.atos_db_file(args.output_file)
             atos_lib.atos_client_db(db).add_result(entry)
         elif args.record:
+            # parallel runs results are grouped by the write-behind queue
             db = atos_lib.atos_db.db(args.configuration_path)
-            atos_lib.atos_client_db(db).add_result(entry)
+            atos_lib.atos_client_db(db).add_result(
+                entry, queued=multiprocess.enabled())
         else:
             print >>sys.stderr, atos_lib.atos_db_file.entry_str(entry),
 
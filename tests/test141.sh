@@ -0,0 +1,41 @@
+#!/usr/bin/env bash
+#
+#
+
+source `dirname $0`/common.sh
+
+TEST_CASE="ATOS lib sqlite database"
+
+$ROOT/bin/atos lib create_db -C SQLDB -t sqlite
+[ -f SQLDB/results.sqlite ]
+
+$ROOT/bin/atos lib add_result -C SQLDB \
+    -r "target:sha1-c,variant:REF,time:10,size:100,cookies:c1,hash:h1"
+$ROOT/bin/atos lib add_result -C SQLDB \
+    -r "target:sha1-c,variant:OPT-O2,time:8,size:110,cookies:c1,hash:h2"
+$ROOT/bin/atos lib add_result -C SQLDB \
+    -r "target:sha1-c,variant:OPT-O3,time:7,size:120,cookies:c2,hash:h2,conf:-O3"
+
+# indexed, regexp and jsonpath queries
+[ `$ROOT/bin/atos lib query -C SQLDB | grep target | wc -l` -eq 3 ]
+[ `$ROOT/bin/atos lib query -C SQLDB -q'variant:REF' | grep target | wc -l` -eq 1 ]
+[ `$ROOT/bin/atos lib query -C SQLDB -q'variant:OPT-.*' | grep target | wc -l` -eq 2 ]
+[ `$ROOT/bin/atos lib query -C SQLDB -q'hash:h2,conf:-O3' | grep target | wc -l` -eq 1 ]
+[ `$ROOT/bin/atos lib query -C SQLDB -q'$[*].size' | wc -l` -eq 3 ]
+
+# speedups on sqlite database
+[ `$ROOT/bin/atos lib speedups -C SQLDB | grep speedup | wc -l` -eq 3 ]
+
+# db push/pull from/to sqlite database
+$ROOT/bin/atos lib create_db -C NEWDB
+$ROOT/bin/atos lib push -C SQLDB -R NEWDB --force
+[ `$ROOT/bin/atos lib query -C NEWDB | grep target | wc -l` -eq 3 ]
+
+$ROOT/bin/atos lib create_db -C NEWDB2 -t sqlite
+$ROOT/bin/atos lib pull -C NEWDB2 -R NEWDB --force
+[ `$ROOT/bin/atos lib query -C NEWDB2 | grep target | wc -l` -eq 3 ]
+
+$ROOT/bin/atos lib create_db -C NEWDB3 -t sqlite
+$ROOT/bin/atos lib push -C NEWDB2 -R- \
+    | $ROOT/bin/atos lib pull -C NEWDB3 -R- --force
+[ `$ROOT/bin/atos lib query -C NEWDB3 -q'variant:OPT-O2' | grep target | wc -l` -eq 1 ]
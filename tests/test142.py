@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, json
+import cPickle as pickle
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib json/pickle database journal"
+
+
+def entry(num):
+    return {'target': 'sha1-c', 'variant': 'OPT-O%d' % num,
+            'time': 10.0 - num, 'size': 100 + num}
+
+for (db_type, db_name, load) in [
+    ('json', 'results.json', json.load),
+    ('pickle', 'results.pkl', pickle.load)]:
+    atos_config = 'atos-config-%s' % db_type
+    os.mkdir(atos_config)
+    db_file = os.path.join(atos_config, db_name)
+    journal_file = db_file + '.journal'
+
+    db = {'json': atos_lib.atos_db_json,
+          'pickle': atos_lib.atos_db_pickle}[db_type](db_file)
+    db.add_results([entry(1)])
+    db.add_results([entry(2), entry(3)])
+
+    # new results are only appended to the journal
+    assert len(load(open(db_file))) == 0
+    assert os.path.getsize(journal_file) > 0
+
+    # readers merge snapshot and journal
+    new_db = atos_lib.atos_db.db(atos_config)
+    assert isinstance(new_db, type(db))
+    assert len(new_db.get_results()) == 3
+    assert len(new_db.get_results({'variant': 'OPT-O2'})) == 1
+
+    # explicit compaction
+    new_db.compact()
+    assert len(load(open(db_file))) == 3
+    assert os.path.getsize(journal_file) == 0
+    assert len(atos_lib.atos_db.db(atos_config).get_results()) == 3
+
+    # compaction triggered by journal size
+    min_size = atos_lib.atos_db_journal.journal_min_size
+    ratio = atos_lib.atos_db_journal.journal_ratio
+    atos_lib.atos_db_journal.journal_ratio = 0
+    db.add_results([entry(4)])
+    entry_size = os.path.getsize(journal_file)
+    assert entry_size > 0
+    atos_lib.atos_db_journal.journal_min_size = 2 * entry_size
+    db.add_results([entry(5)])
+    assert os.path.getsize(journal_file) == 0
+    atos_lib.atos_db_journal.journal_min_size = min_size
+    atos_lib.atos_db_journal.journal_ratio = ratio
+    assert len(load(open(db_file))) == 5
+    assert len(db.get_results()) == 5
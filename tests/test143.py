@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib results.db incremental reload"
+
+
+def entry_str(num):
+    return atos_lib.atos_db_file.entry_str(
+        {'target': 'sha1-c', 'variant': 'OPT-O%d' % num,
+         'time': 10.0 - num, 'size': 100 + num})
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+db_file = os.path.join(atos_config, 'results.db')
+
+db = atos_lib.atos_db.db(atos_config)
+db.add_results([{'target': 'sha1-c', 'variant': 'REF',
+                 'time': 10.0, 'size': 100}])
+assert len(db.get_results()) == 1
+
+# results appended by another process, last one being incomplete
+with open(db_file, 'a') as dbf:
+    dbf.write(entry_str(1))
+    dbf.write(entry_str(2))
+    dbf.write(entry_str(3)[:-10])
+
+offset = db.db_offset
+assert atos_lib.atos_db.db(atos_config) is db
+assert len(db.get_results()) == 3
+assert db.db_offset == offset + len(entry_str(1)) + len(entry_str(2))
+
+# end of the incomplete record
+with open(db_file, 'a') as dbf:
+    dbf.write(entry_str(3)[-10:])
+db.add_results([{'target': 'sha1-c', 'variant': 'OPT-O4',
+                 'time': 6.0, 'size': 104}])
+assert map(lambda x: x['variant'], db.get_results()) == [
+    'REF', 'OPT-O1', 'OPT-O2', 'OPT-O3', 'OPT-O4']
+assert db.db_offset == os.path.getsize(db_file)
+
+# same results as a full parse
+full_results = atos_lib.atos_db_file._read_results_lines(
+    open(db_file).readlines())
+assert full_results == db.get_results()
+
+# replaced database file is fully parsed again
+os.rename(db_file, db_file + '.old')
+with open(db_file, 'w') as dbf:
+    dbf.write(entry_str(5))
+atos_lib.atos_db.db(atos_config)
+assert len(db.get_results()) == 1
+assert db.get_results()[0]['variant'] == 'OPT-O5'
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, re, random
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib results indexes and queries"
+
+
+random.seed(0)
+results = []
+for num in range(500):
+    entry = {'target': random.choice(['sha1-c', 'bzip2', 'zlib']),
+             'variant': 'OPT-O%d' % random.randint(0, 20),
+             'time': float(random.randint(10, 99)), 'size': random.randint(1, 9),
+             'cookies': ','.join(random.sample(
+                    ['c1', 'c2', 'c3', 'c4', 'c5'], random.randint(1, 2))),
+             'conf': random.choice(['-O2', '-O3'])}
+    if num % 3: entry['hash'] = 'h%d' % random.randint(0, 10)
+    if num % 10 == 0: entry['variant'] = 'REF'
+    results.append(entry)
+
+queries = [
+    {'variant': 'REF'},
+    {'variant': 'OPT-O1'},
+    {'variant': 'OPT-O1.*'},
+    {'variant': 'OPT-O(1|2)', 'target': 'zlib'},
+    {'target': 'bzip2', 'hash': 'h3'},
+    {'hash': ''},
+    {'hash': None},
+    {'target': 'sha1-c', 'conf': '-O3'},
+    {'conf': '-O2'},
+    {'variant': 'unknown'},
+    {'variant': 'OPT-O1', 'conf': '.*'},
+    {'conf': '-O[23]', 'cookies': 'c1(,.*)?'},
+    dict.fromkeys(atos_lib.atos_db.keys, '.*'),
+    ]
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+db = atos_lib.atos_db.db(atos_config)
+db.add_results(results[:250])
+db.add_results(results[250:])
+other_dbs = [atos_lib.atos_db_file(os.path.join(atos_config, 'results.db'))]
+for (db_func, db_name) in [(atos_lib.atos_db_json, 'results.json'),
+                           (atos_lib.atos_db_sqlite, 'results.sqlite'),
+                           (atos_lib.atos_db_binary, 'results.bin')]:
+    other_db = db_func(os.path.join(atos_config, db_name))
+    other_db.add_results(results)
+    other_dbs.append(other_db)
+
+def reference_filter(results, query):
+    return filter(lambda x: all(
+            map(lambda (k, v): re.match('^%s$' % v, x.get(k, '')),
+                query.items())), results)
+
+for query in queries:
+    expected = atos_lib.results_filter(results, query)
+    assert expected == reference_filter(results, query)
+    for some_db in [db] + other_dbs:
+        assert some_db.get_results(query) == expected
+
+for cookies in [['c1'], ['c2', 'c5'], ['c6'], ['c3', 'c6']]:
+    expected = atos_lib.results_filter_cookies(results, cookies)
+    for some_db in [db] + other_dbs:
+        assert some_db.get_cookies_results(cookies) == expected
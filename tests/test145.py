@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, random
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib merged results from indexed databases"
+
+
+random.seed(0)
+results = []
+for num in range(400):
+    entry = {'target': random.choice(['sha1-c', 'bzip2']),
+             'variant': 'OPT-O%d' % random.randint(0, 15),
+             'time': float(random.randint(10, 99)), 'size': random.randint(1, 9),
+             'cookies': ','.join(random.sample(
+                    ['c1', 'c2', 'c3', 'c4'], random.randint(1, 2)))}
+    if num % 10 == 0: entry['variant'] = 'REF'
+    if num % 17 == 0: entry['time'] = 'FAILURE'
+    results.append(entry)
+
+def same_results(results1, results2):
+    if results1 is None or results2 is None:
+        return results1 is None and results2 is None
+    def values(result):
+        return (result.variant, result.target, result.time, result.size,
+                map(lambda x: x.time, result._results),
+                getattr(result, '_last', result).time)
+    return map(values, results1) == map(values, results2)
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+dbs = [atos_lib.atos_db.db(atos_config),
+       atos_lib.atos_db_json(os.path.join(atos_config, 'results.json')),
+       atos_lib.atos_db_sqlite(os.path.join(atos_config, 'results.sqlite'))]
+for db in dbs:
+    db.add_results(results[:200])
+
+for num in range(2):
+    for db in dbs:
+        for query in [None, {'variant': 'REF'}, {'variant': 'OPT-O1.*'},
+                      {'target': 'bzip2'}, {'variant': 'unknown'}]:
+            for merge_targets in [True, False]:
+                assert same_results(
+                    db.get_merged_results(query, merge_targets),
+                    atos_lib.merge_results(
+                        db.get_results(query), merge_targets))
+        for cookies in [['c1'], ['c2', 'c4'], ['c5']]:
+            assert same_results(
+                db.get_merged_cookies_results(cookies),
+                atos_lib.merge_results(db.get_cookies_results(cookies)))
+    # merged results must follow newly added runs
+    for db in dbs:
+        db.add_results(results[200:])
+
+# results with times given as strings
+str_results = [{'target': 'str', 'variant': 'OPT-str', 'time': time,
+                'size': 10, 'cookies': 'c6'} for time in ['1.5', '2.5']]
+paths = [os.path.join(atos_config, 'results.str.db'),
+         os.path.join(atos_config, 'results.json'),
+         os.path.join(atos_config, 'results.pkl')]
+dbs = [atos_lib.atos_db_file(paths[0]),
+       atos_lib.atos_db_json(paths[1]), atos_lib.atos_db_pickle(paths[2])]
+for db in dbs:
+    db.add_results(str_results)
+    merged = db.get_merged_results({"target": "str"})
+    assert len(merged) == 1 and merged[0].time == 2.0
+# databases can still be reopened
+reopened = [atos_lib.atos_db_file(paths[0]),
+            atos_lib.atos_db_json(paths[1]), atos_lib.atos_db_pickle(paths[2])]
+for db in reopened:
+    assert len(db.get_results({'target': 'str'})) == 2
+    merged = db.get_merged_results({"target": "str"})
+    assert merged[0].time == 2.0
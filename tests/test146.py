@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import random
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib frontier computation"
+
+
+def reference_frontier(results):
+    # a result is dominated by a different result of lower size and time
+    return map(lambda c1: not any(map(lambda c2: (
+                    (c2.time, c2.size) != (c1.time, c1.size) and
+                    c2.time <= c1.time and c2.size <= c1.size), results)),
+               results)
+
+random.seed(0)
+for num in range(50):
+    results = map(lambda x: atos_lib.atos_client_results.result(
+            {'variant': 'OPT-%d' % x, 'target': 'sha1-c',
+             'time': float(random.randint(1, 30)),
+             'size': random.randint(1, 30)}), range(random.randint(1, 120)))
+    expected = reference_frontier(results)
+
+    atos_lib.atos_client_results.set_frontier_field(results)
+    assert map(lambda x: x.on_frontier, results) == expected
+
+    for result in results: del result.on_frontier
+    frontier = atos_lib.results_frontier()
+    for (count, result) in enumerate(results):
+        frontier.insert(result)
+        assert map(lambda x: x.on_frontier, results[:count + 1]) == (
+            reference_frontier(results[:count + 1]))
+    frontier_results = frontier.results()
+    assert sorted(frontier_results, key=lambda x: x.size) == frontier_results
+    assert set(frontier_results) == set(
+        filter(lambda x: x.on_frontier, results))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import random
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib columnar results"
+
+if atos_lib.numpy is None:
+    common.skip("numpy module not available")
+
+
+def new_results(count):
+    return map(lambda x: atos_lib.atos_client_results.result(
+            {'variant': 'OPT-%d' % random.randint(0, count / 2),
+             'target': random.choice(['sha1-c', 'bzip2']),
+             'time': float(random.randint(1, 30)),
+             'size': random.randint(1, 30),
+             'cookies': ','.join(random.sample(
+                        ['c1', 'c2', 'c3', 'c4'], random.randint(0, 2)))}),
+               range(count))
+
+def with_columns(enabled, func, *args):
+    atos_lib.results_columns.min_size = enabled and 0 or (1 << 30)
+    try:
+        return func(*args)
+    finally:
+        atos_lib.results_columns.min_size = 1024
+
+def fields(results, *names):
+    return map(lambda x: tuple(map(lambda y: getattr(x, y), names)), results)
+
+random.seed(0)
+ref = atos_lib.atos_client_results.result(
+    {'variant': 'REF', 'target': 'sha1-c', 'time': 20.0, 'size': 20})
+for num in range(20):
+    results = new_results(random.randint(1, 200))
+
+    for result in results: result.compute_speedup(ref)
+    expected = fields(results, 'speedup', 'sizered')
+    columns = atos_lib.results_columns(results)
+    columns.compute_speedups(ref)
+    columns.set_fields('speedup', 'sizered')
+    assert fields(results, 'speedup', 'sizered') == expected
+
+    for enabled in [False, True]:
+        with_columns(enabled, atos_lib.atos_client_results.set_frontier_field,
+                     results)
+        if not enabled: expected = fields(results, 'on_frontier')
+        assert fields(results, 'on_frontier') == expected
+
+    for (ratio, nb_points) in [(4, 3), (0.5, 1), (1, 10)]:
+        assert with_columns(
+            True, atos_lib.atos_client_results.select_tradeoffs,
+            results, ratio, nb_points) == with_columns(
+            False, atos_lib.atos_client_results.select_tradeoffs,
+            results, ratio, nb_points)
+
+    for key in ['variant', 'target']:
+        assert with_columns(
+            True, atos_lib.results_statistics, results, key) == with_columns(
+            False, atos_lib.results_statistics, results, key)
+
+    cookie_to_gen = {'c2': 0, 'c3': 1, 'c4': 2}
+    expected = map(lambda x: ([cookie_to_gen[c] for c in x.cookies.split(',')
+                               if c in cookie_to_gen] + [-1])[0], results)
+    assert columns.cookie_groups(cookie_to_gen).tolist() == expected
@@ -0,0 +1,52 @@
+#!/usr/bin/env bash
+#
+#
+
+source `dirname $0`/common.sh
+
+TEST_CASE="ATOS lib JSON lines query/push/pull"
+
+for db in DB SQLDB; do
+    [ $db = SQLDB ] && type=sqlite || type=results_db
+    $ROOT/bin/atos lib create_db -C $db -t $type
+    for i in 1 2 3 4 5; do
+        $ROOT/bin/atos lib add_result -C $db \
+            -r "target:sha1-c,variant:OPT-O$i,time:1$i,size:10$i,cookies:c$i"
+    done
+
+    # one result per line
+    $ROOT/bin/atos lib query -C $db --lines > lines.txt
+    [ `cat lines.txt | wc -l` -eq 5 ]
+    [ `grep '^{.*"variant": "OPT-O3"' lines.txt | wc -l` -eq 1 ]
+    [ `$ROOT/bin/atos lib query -C $db --lines -q'variant:OPT-O[12]' \
+        | wc -l` -eq 2 ]
+
+    # query on JSON lines and JSON list input
+    [ `$ROOT/bin/atos lib query -C- --lines -q'variant:OPT-O[12]' \
+        < lines.txt | wc -l` -eq 2 ]
+    $ROOT/bin/atos lib query -C $db > list.txt
+    [ `$ROOT/bin/atos lib query -C- --lines -q'variant:OPT-O[12]' \
+        < list.txt | wc -l` -eq 2 ]
+    [ `$ROOT/bin/atos lib query -C- -q'variant:OPT-O[12]' \
+        < lines.txt | grep target | wc -l` -eq 2 ]
+
+    # push/pull pipeline
+    rm -rf NEWDB
+    $ROOT/bin/atos lib create_db -C NEWDB -t json
+    $ROOT/bin/atos lib push -C $db -R- --lines -q'variant:OPT-O[1-4]' \
+        | $ROOT/bin/atos lib pull -C NEWDB -R- --force
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 4 ]
+    $ROOT/bin/atos lib query -C $db --lines \
+        | $ROOT/bin/atos lib pull -C NEWDB -R- --force
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 5 ]
+    $ROOT/bin/atos lib query -C $db --lines \
+        | $ROOT/bin/atos lib pull -C NEWDB -R- --force --duplicates
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 10 ]
+done
+
+# empty databases
+rm -rf NEWDB
+$ROOT/bin/atos lib create_db -C NEWDB
+[ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 0 ]
+$ROOT/bin/atos lib push -C NEWDB -R- | $ROOT/bin/atos lib pull -C DB -R- -f
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 5 ]
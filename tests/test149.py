@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib result records"
+
+
+result = atos_lib.atos_client_results.result
+
+entries = [
+    {'target': 'sha1-c', 'variant': 'REF', 'time': 1.0 / 3, 'size': 100,
+     'cookies': 'c1,c2', 'conf': '-O2', 'extra': u'value', 'count': 3L},
+    {'target': 'sha1-c', 'variant': 'OPT-O3', 'time': 'FAILURE',
+     'size': 'FAILURE'}]
+
+records = result.records(entries)
+assert map(lambda x: x.dict(), records) == map(
+    lambda x: result(x).dict(), entries)
+
+# standard fields are in slots, others in the instance dict
+ref = records[0]
+assert ref.__dict__ == {'extra': u'value', 'count': 3L}
+assert ref.time == float(str(1.0 / 3)) and ref.size == 100
+assert ref.dict() == dict(entries[0], time=float(str(1.0 / 3)))
+assert getattr(ref, 'speedup', None) is None and not hasattr(ref, 'hash')
+
+# copies are shallow and keep internal fields
+ref._results = [records[1]]
+copy = ref.copy()
+assert copy.fields() == ref.fields() and copy._results is ref._results
+copy.time, copy.other = 2.0, 1
+assert ref.time != 2.0 and not hasattr(ref, 'other')
+
+# merged results
+runs = result.records([
+        {'target': 'sha1-c', 'variant': 'OPT', 'time': 10.0, 'size': 10},
+        {'target': 'sha1-c', 'variant': 'OPT', 'time': 20.0, 'size': 10},
+        {'target': 'bzip2', 'variant': 'OPT', 'time': 60.0, 'size': 5}])
+merged = result.merge_targets('all', [
+        result.merge_multiple_runs(runs[:2]),
+        result.merge_multiple_runs(runs[2:])])
+assert (merged.target, merged.size) == ('all', 15)
+assert abs(merged.time - 30.0) < 1e-9
+assert abs(merged._last.time - (20.0 * 60.0) ** 0.5) < 1e-9
+assert merged._results[0]._results == runs[:2]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib binary database"
+
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+db_file = os.path.join(atos_config, 'results.bin')
+db = atos_lib.atos_db_binary(db_file)
+assert db.get_results() == []
+
+results = [
+    {'target': 'sha1-c', 'variant': 'REF', 'time': 10.0, 'size': 100,
+     'cookies': 'c1', 'conf': ''},
+    {'target': 'sha1-c', 'variant': 'OPT-O2', 'time': 8.0, 'size': 110,
+     'cookies': 'c1,c2', 'conf': '-O2', 'hash': 'h2'},
+    {'target': 'sha1-c', 'variant': 'OPT-O3', 'time': 'FAILURE',
+     'size': 'FAILURE', 'cookies': 'c3', 'conf': '-O3', 'hash': 'h3'},
+    {'target': 'bzip2', 'variant': 'OPT-O2', 'time': 7.5, 'size': 90,
+     'cookies': 'c2', 'conf': u'-O2 -DNAME=\xe9'}]
+db.add_results(results[:2])
+assert db.get_results() == results[:2]
+
+# database found in configuration directory, opened by another process
+other_db = atos_lib.atos_db.db(atos_config)
+assert isinstance(other_db, atos_lib.atos_db_binary)
+assert other_db.get_results() == results[:2]
+other_db.add_results(results[2:])
+
+# rows added by the other process are mapped on refresh
+assert db.get_results({'variant': 'OPT-O2'}) == results[1:2]
+db.refresh()
+assert db.get_results() == results
+assert db.get_results({'variant': 'OPT-O2'}) == [results[1], results[3]]
+assert db.get_results({'variant': 'OPT-.*', 'target': 'sha1-c'}) == (
+    results[1:3])
+assert db.get_results({'hash': ''}) == [results[0], results[3]]
+assert db.get_results({'conf': '-O2.*'}) == [results[1], results[3]]
+assert db.get_results({'variant': 'OPT-O2', 'conf': '-O2'}) == results[1:2]
+assert db.get_results('$[*].target') == [
+    'sha1-c', 'sha1-c', 'sha1-c', 'bzip2']
+assert db.get_cookies_results(['c2']) == [results[1], results[3]]
+assert db.get_cookies_results(['c3', 'c4']) == results[2:3]
+
+merged = db.get_merged_results({'target': 'sha1-c'})
+assert map(lambda x: x.variant, merged) == ['REF', 'OPT-O2']
+
+# strings are shared in the string table within a batch
+strings_size = os.path.getsize(db_file + '.str')
+db.add_results([dict(results[0], time=float(x)) for x in range(1, 10)])
+assert os.path.getsize(db_file + '.str') - strings_size < 9 * 150
+assert len(atos_lib.atos_db_binary(db_file).get_results(
+        {'variant': 'REF'})) == 10
+
+# string time and size, as read from a text database
+string_result = dict(results[0], time='1.5', size='100')
+db.add_results([string_result])
+assert atos_lib.atos_db_binary(db_file).get_results()[-1] == string_result
+
+# incomplete row being written is ignored
+with open(db_file, 'ab') as rows_file: rows_file.write('\0' * 10)
+assert len(atos_lib.atos_db_binary(db_file).get_results()) == 14
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, threading
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib results write-behind queue"
+
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+db = atos_lib.atos_db.db(atos_config)
+other_db = atos_lib.atos_db_json(os.path.join(atos_config, 'results.json'))
+
+# count database writes
+writes = []
+def counted(db):
+    add_results = db.add_results
+    def wrapper(entries):
+        writes.append(len(entries))
+        return add_results(entries)
+    db.add_results = wrapper
+map(counted, [db, other_db])
+
+def run(num):
+    for run in range(10):
+        client = atos_lib.atos_client_db(run % 2 and other_db or db)
+        client.add_result({'target': 'sha1-c', 'variant': 'OPT-%d' % num,
+                           'time': float(run + 1), 'size': 10}, queued=True)
+
+atos_lib.atos_db_writer.interval = 1.0
+threads = [threading.Thread(target=run, args=(x,)) for x in range(20)]
+map(lambda x: x.start(), threads)
+map(lambda x: x.join(), threads)
+atos_lib.atos_db_writer.flush_results()
+
+# all results written, grouped in few writes
+assert sum(writes) == 200 and len(writes) <= 4
+for some_db in [db, other_db]:
+    results = some_db.get_results()
+    assert len(results) == 100
+    for num in range(20):
+        assert len(filter(lambda x: x['variant'] == 'OPT-%d' % num,
+                          results)) == 5
+
+# results are written on exit
+atos_lib.atos_client_db(db).add_result(
+    {'target': 'sha1-c', 'variant': 'LAST', 'time': 1.0, 'size': 10},
+    queued=True)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, json
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib cookies database journal"
+
+
+def expected_cookies(events):
+    # same result as the former full rewrite of cookies.db
+    cookies = {}
+    for (value, parent, description, userset) in events:
+        cookie = cookies.setdefault(value, {})
+        if description: cookie['description'] = description
+        if userset: cookie['userset'] = True
+        if parent:
+            succs = cookies.setdefault(parent, {}).setdefault('succs', [])
+            if value not in succs: succs.append(value)
+    return cookies
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+db_file = os.path.join(atos_config, 'cookies.db')
+
+events = [('root', None, 'exploration', True)]
+for stage in range(5):
+    events.append(('s%d' % stage, 'root', 'stage %d' % stage, False))
+    for num in range(20):
+        events.append(('s%d-c%d' % (stage, num), 's%d' % stage, None, False))
+        # cookies recorded several times
+        events.append(('s%d-c%d' % (stage, num % 5), 's%d' % stage,
+                       None, False))
+    events.append(('s%d' % stage, 'root', None, False))
+
+db = atos_lib.atos_cookie_db_json(atos_config)
+for event in events[:50]: db.add_cookie(*event)
+# journal only, snapshot unchanged
+assert json.load(open(db_file)) == {}
+assert db.cookies == expected_cookies(events[:50])
+
+# other process reads the journal, adds more cookies
+other_db = atos_lib.atos_cookie_db_json(atos_config)
+assert other_db.cookies == expected_cookies(events[:50])
+for event in events[50:]: other_db.add_cookie(*event)
+assert other_db.cookies == expected_cookies(events)
+assert map(lambda x: x[0], filter(lambda x: x[1] == 'root', events)[::2]) == (
+    other_db.cookies['root']['succs'])
+
+# compaction keeps all cookies
+other_db.compact()
+assert os.path.getsize(db_file + '.journal') == 0
+assert json.load(open(db_file)) == expected_cookies(events)
+assert atos_lib.atos_cookie_db_json(atos_config).cookies == (
+    expected_cookies(events))
+
+# compaction on journal size
+atos_lib.atos_cookie_db_json.journal_min_size = 1024
+more_events = map(lambda x: ('c%d' % x, 'root', None, False), range(100))
+for event in more_events: db.add_cookie(*event)
+assert json.load(open(db_file)) != expected_cookies(events)
+assert os.path.getsize(db_file + '.journal') < 1024
+assert atos_lib.atos_cookie_db_json(atos_config).cookies == (
+    expected_cookies(events + more_events))
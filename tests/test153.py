@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, json
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib hashsum database journal"
+
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+db_file = os.path.join(atos_config, 'hashsum.db')
+
+db = atos_lib.atos_buildhash_db(atos_config)
+db.add_hashsum('h1', 'OPT-O2')
+db.add_hashsum('h1', 'OPT-O3')
+db.add_hashsum('h1', 'OPT-O2')
+db.add_hashsum('h2', 'OPT-O1')
+assert db.get_variants('h1') == ['OPT-O2', 'OPT-O3']
+assert db.get_variants('h3') == []
+assert json.load(open(db_file)) == {}
+
+# hashsums added by another process are seen on lookup
+other_db = atos_lib.atos_buildhash_db(atos_config)
+assert other_db.get_variants('h1') == ['OPT-O2', 'OPT-O3']
+other_db.add_hashsum('h3', 'OPT-Os')
+other_db.compact()
+assert json.load(open(db_file)) == {
+    'h1': ['OPT-O2', 'OPT-O3'], 'h2': ['OPT-O1'], 'h3': ['OPT-Os']}
+assert db.get_variants('h3') == ['OPT-Os']
+db.add_hashsum('h3', 'OPT-O3')
+assert other_db.get_variants('h3') == ['OPT-Os', 'OPT-O3']
+
+# concurrent writers with compactions
+atos_lib.atos_json_journal.journal_min_size = 512
+children = []
+for num in range(4):
+    pid = os.fork()
+    if not pid:
+        child_db = atos_lib.atos_buildhash_db(atos_config)
+        for hashnum in range(100):
+            child_db.add_hashsum('hash%d' % hashnum, 'variant%d' % num)
+        os._exit(0)
+    children.append(pid)
+for pid in children:
+    assert os.waitpid(pid, 0)[1] == 0
+
+db = atos_lib.atos_buildhash_db(atos_config)
+for hashnum in range(100):
+    assert sorted(db.get_variants('hash%d' % hashnum)) == map(
+        lambda x: 'variant%d' % x, range(4))
+assert db.get_variants('h3') == ['OPT-Os', 'OPT-O3']
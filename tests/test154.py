@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib cached database coherence"
+
+
+def entry(num, variant='REF'):
+    return {'target': 'sha1', 'variant': variant, 'conf': 'conf',
+            'time': 10.0 + num, 'size': 100 + num}
+
+def add_in_child(db_file, entries, compact=False):
+    # other process adding results to the database
+    pid = os.fork()
+    if pid == 0:
+        try:
+            db = atos_lib.atos_db.db(db_file)
+            db.add_results(entries)
+            if compact: db.compact()
+        finally: os._exit(0)
+    os.waitpid(pid, 0)
+
+for db_name in ['results.db', 'results.json', 'results.pkl']:
+    atos_config = 'atos-config-' + db_name.split('.')[1]
+    os.mkdir(atos_config)
+    db_file = os.path.join(atos_config, db_name)
+    if db_name == 'results.db': open(db_file, 'w').close()
+    elif db_name == 'results.json': atos_lib.atos_db_json(db_file)
+    else: atos_lib.atos_db_pickle(db_file)
+
+    db = atos_lib.atos_db.db(db_file)
+    db.add_results([entry(num) for num in range(10)])
+
+    # cached handle sees results added by other processes
+    add_in_child(db_file, [entry(num) for num in range(10, 15)])
+    cached_db = atos_lib.atos_db.db(db_file)
+    assert cached_db is db
+    assert len(cached_db.get_results()) == 15
+
+    # only the delta is read: the index is extended in place
+    index = db.index
+    add_in_child(db_file, [entry(num, 'OPT') for num in range(5)])
+    assert len(atos_lib.atos_db.db(db_file).get_results()) == 20
+    assert len(db.get_results({'variant': 'OPT'})) == 5
+    if db_name != 'results.db':
+        assert db.index is index
+
+    # unchanged files: nothing read
+    atos_lib.atos_db.db(db_file)
+    assert db.index is index
+
+    # own additions do not trigger a reload
+    db.add_results([entry(num, 'OPT2') for num in range(3)])
+    atos_lib.atos_db.db(db_file)
+    if db_name != 'results.db':
+        assert db.index is index
+    assert len(db.get_results()) == 23
+
+    # compaction by another process is detected
+    if db_name != 'results.db':
+        add_in_child(db_file, [entry(99)], compact=True)
+        assert os.path.getsize(db_file + '.journal') == 0
+        assert len(atos_lib.atos_db.db(db_file).get_results()) == 24
+        assert db.index is not index
+        assert len(db.get_results({'variant': 'REF'})) == 16
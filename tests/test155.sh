@@ -0,0 +1,74 @@
+#!/usr/bin/env bash
+#
+#
+
+source `dirname $0`/common.sh
+
+TEST_CASE="ATOS lib push/pull deduplication and watermark"
+
+$ROOT/bin/atos lib create_db -C DB
+for i in 1 2 3; do
+    $ROOT/bin/atos lib add_result -C DB \
+        -r "target:sha1-c,variant:OPT-O$i,time:1$i,size:10$i,cookies:c$i"
+done
+# repeated run with the same result
+$ROOT/bin/atos lib add_result -C DB \
+    -r "target:sha1-c,variant:OPT-O1,time:11,size:101,cookies:c1"
+
+for type in results_db json pickle sqlite binary; do
+    rm -rf NEWDB
+    $ROOT/bin/atos lib create_db -C NEWDB -t $type
+
+    # repeated pulls do not duplicate results, repeated runs are kept
+    $ROOT/bin/atos lib pull -C NEWDB -R DB -f 2>&1 | tee pull.log
+    grep -q "imported 4 results" pull.log
+    grep -q "watermark: 4:" pull.log
+    $ROOT/bin/atos lib pull -C NEWDB -R DB -f 2>&1 | tee pull.log
+    grep -q "imported 0 results" pull.log
+    grep -q "skipped 4 duplicated results" pull.log
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 4 ]
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines -q variant:OPT-O1 \
+        | wc -l` -eq 2 ]
+
+    # incremental push from the last watermark
+    for i in 4 5; do
+        $ROOT/bin/atos lib add_result -C DB \
+            -r "target:sha1-c,variant:OPT-O$i,time:1$i,size:10$i,cookies:c$i"
+    done
+    since=`sed -n 's/.*watermark: //p' pull.log`
+    $ROOT/bin/atos lib push -C DB -R NEWDB -f --since $since 2>&1 \
+        | tee push.log
+    grep -q "exported 2 results" push.log
+    grep -q "watermark: 6:" push.log
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 6 ]
+    since=`sed -n 's/.*watermark: //p' push.log`
+    [ `$ROOT/bin/atos lib push -C DB -R- --lines --since $since | wc -l` \
+        -eq 0 ]
+
+    # watermark of a changed stream is rejected
+    if $ROOT/bin/atos lib push -C DB -R- --lines --since $since \
+        -q variant:OPT-O1; then false; fi
+    if $ROOT/bin/atos lib push -C DB -R- --lines --since 4:000000000000; then
+        false; fi
+
+    # same results from a stream with a stale watermark
+    $ROOT/bin/atos lib push -C DB -R- --lines --since 2 \
+        | $ROOT/bin/atos lib pull -C NEWDB -R- -f
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 6 ]
+
+    # keep duplicates on request
+    $ROOT/bin/atos lib pull -C NEWDB -R DB -f --duplicates --since 5
+    [ `$ROOT/bin/atos lib query -C NEWDB --lines | wc -l` -eq 7 ]
+
+    $ROOT/bin/atos lib query -C DB --lines > lines.txt
+    head -4 lines.txt > lines4.txt
+    rm -rf DB && $ROOT/bin/atos lib create_db -C DB
+    $ROOT/bin/atos lib pull -C DB -R- -f < lines4.txt
+done
+
+# watermark of a compacted database is rejected
+$ROOT/bin/atos lib pull -C NEWDB -R DB -f 2>&1 | tee pull.log
+since=`sed -n 's/.*watermark: //p' pull.log`
+$ROOT/bin/atos lib pull -C NEWDB -R DB -f --since $since
+$ROOT/bin/atos lib compact -C DB --aggregate
+if $ROOT/bin/atos lib pull -C NEWDB -R DB -f --since $since; then false; fi
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib results.db parallel parsing and cache"
+
+
+def entry_str(num, extra_keys=0):
+    entry = {'target': 'sha1-c', 'variant': 'OPT-O%d' % num,
+             'time': 10.0 + num, 'size': 100 + num}
+    for key in range(extra_keys):
+        entry['key%d' % key] = 'value %d: %d' % (num, key)
+    return atos_lib.atos_db_file.entry_str(entry)
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+db_file = os.path.join(atos_config, 'results.db')
+with open(db_file, 'w') as dbf:
+    for num in range(2000):
+        dbf.write(entry_str(num, num % 7))
+    # record with time before size, and incomplete last record
+    dbf.write('ATOS: sha1-c: OPT-X: time: 1.5\n')
+    dbf.write('ATOS: sha1-c: OPT-X: size: 15\n')
+    dbf.write(entry_str(2000, 3)[:-5])
+
+lines = open(db_file).readlines()
+expected, parsed = atos_lib.atos_db_file._parse_results_lines(lines[:-1])
+assert len(expected) == 2001
+
+# parallel parsing by chunks gives the same results
+size = os.path.getsize(db_file)
+atos_lib.multiprocessing.cpu_count = lambda: 8
+for nchunks in [1, 2, 3, 7, 50]:
+    atos_lib.atos_db_file.chunk_min_size = size // nchunks + 1
+    results, length = atos_lib.atos_db_file._parse_results_file(
+        db_file, 0, size)
+    assert (results, length) == (expected, parsed)
+
+# parse of large databases with cache of the complete records
+atos_lib.atos_db_file.parallel_min_size = 1000
+atos_lib.atos_db_file.chunk_min_size = 5000
+db = atos_lib.atos_db_file(db_file)
+assert db.get_results() == expected
+assert db.db_offset == parsed
+assert os.path.exists(db_file + '.cache')
+cached_db = atos_lib.atos_db_file(db_file)
+assert cached_db.get_results() == expected
+assert cached_db.db_offset == parsed
+
+# only the records appended since are parsed
+with open(db_file, 'a') as dbf:
+    dbf.write(entry_str(2000, 3)[-5:])
+db.refresh()
+assert len(db.get_results()) == 2002
+parse_lines = atos_lib.atos_db_file._parse_results_lines
+tail_sizes = []
+def parse_tail(lines):
+    tail_sizes.append(len(''.join(lines)))
+    return parse_lines(lines)
+atos_lib.atos_db_file._parse_results_lines = staticmethod(parse_tail)
+new_db = atos_lib.atos_db_file(db_file)
+assert new_db.get_results() == db.get_results()
+assert tail_sizes == [os.path.getsize(db_file) - parsed]
+db.add_results([{'target': 'sha1-c', 'variant': 'REF',
+                 'time': 10.0, 'size': 100}])
+new_db = atos_lib.atos_db_file(db_file)
+assert len(new_db.get_results()) == 2003
+assert new_db.get_results()[-1]['variant'] == 'REF'
+assert new_db.get_results() == db.get_results()
+atos_lib.atos_db_file._parse_results_lines = staticmethod(parse_lines)
+
+# cache of a replaced database is not used
+os.rename(db_file, db_file + '.old')
+with open(db_file, 'w') as dbf:
+    with open(db_file + '.old') as old:
+        dbf.write(old.read())
+    dbf.write(entry_str(3000))
+new_db = atos_lib.atos_db_file(db_file)
+assert len(new_db.get_results()) == 2004
+assert new_db.get_results()[:-1] == db.get_results()
+
+# serial parse when other threads run
+pool = atos_lib.multiprocessing.Pool
+atos_lib.multiprocessing.Pool = None
+release = atos_lib.threading.Event()
+thread = atos_lib.threading.Thread(target=release.wait)
+thread.start()
+atos_lib.atos_db_file.chunk_min_size = size // 4 + 1
+try:
+    results, length = atos_lib.atos_db_file._parse_results_file(
+        db_file + '.old', 0, size)
+finally:
+    release.set()
+    thread.join()
+    atos_lib.multiprocessing.Pool = pool
+assert (results, length) == (expected, parsed)
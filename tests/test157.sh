@@ -0,0 +1,112 @@
+#!/usr/bin/env bash
+#
+#
+
+source `dirname $0`/common.sh
+
+TEST_CASE="ATOS lib compact"
+
+nb_rows() {
+    case $1 in
+        *.json) python -c "import json,sys; print len(json.load(open(sys.argv[1])))" $1 ;;
+        *.db) grep -c ': time: ' $1 ;;
+    esac
+}
+
+$ROOT/bin/atos lib create_db -C DB
+for i in 1 2 3; do
+    [ $i -eq 1 ] && variant=REF || variant=OPT-O$i
+    for t in 1$i 2$i 3$i; do
+        $ROOT/bin/atos lib add_result -C DB \
+            -r "target:sha1-c,variant:$variant,time:$t,size:10$i,cookies:c$i"
+    done
+done
+$ROOT/bin/atos lib add_result -C DB \
+    -r "target:sha1-c,variant:OPT-O4,time:FAILURE,size:FAILURE"
+$ROOT/bin/atos lib report -C DB -mstdev > report.txt
+# duplicated results
+$ROOT/bin/atos lib query -C DB --lines \
+    | $ROOT/bin/atos lib pull -C DB -R- -f --duplicates
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 20 ]
+
+# duplicates are removed
+$ROOT/bin/atos lib compact -C DB
+[ `nb_rows DB/results.db` -eq 10 ]
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 10 ]
+
+# aggregation keeps the time of each run
+$ROOT/bin/atos lib compact -C DB --aggregate --failures=archive
+[ `nb_rows DB/results.db` -eq 3 ]
+[ `grep -c ': times: ' DB/results.db` -eq 3 ]
+[ `cat DB/results.failures.json | wc -l` -eq 1 ]
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 9 ]
+[ `$ROOT/bin/atos lib query -C DB --lines -q variant:OPT-O2 \
+    | grep -c '"time": 22.0'` -eq 1 ]
+$ROOT/bin/atos lib report -C DB -mstdev | diff - report.txt
+
+# conversions between all database types
+for type in json pickle sqlite binary results_db json; do
+    $ROOT/bin/atos lib compact -C DB -t $type --aggregate
+    [ `ls DB/results.* | grep -v failures | grep -v journal \
+        | grep -v '\.str' | grep -v '\.lock' | wc -l` -eq 1 ]
+    [ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 9 ]
+    $ROOT/bin/atos lib report -C DB -mstdev | diff - report.txt
+done
+[ `nb_rows DB/results.json` -eq 3 ]
+
+# results added after compaction, journal folded
+$ROOT/bin/atos lib add_result -C DB \
+    -r "target:sha1-c,variant:REF,time:41,size:101,cookies:c1"
+$ROOT/bin/atos lib compact -C DB --aggregate
+[ `nb_rows DB/results.json` -eq 3 ]
+[ ! -s DB/results.json.journal ]
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 10 ]
+
+# failures dropped
+$ROOT/bin/atos lib pull -C DB -R- -f < DB/results.failures.json
+[ `$ROOT/bin/atos lib query -C DB --lines -q time:FAILURE | wc -l` -eq 1 ]
+$ROOT/bin/atos lib compact -C DB -t sqlite --failures=drop
+[ `$ROOT/bin/atos lib query -C DB --lines -q time:FAILURE | wc -l` -eq 0 ]
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 10 ]
+$ROOT/bin/atos lib compact -C DB
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 10 ]
+
+# database opened by another process is not converted
+export PYTHONPATH=$ROOT/lib/atos/python:$PYTHONPATH
+hold_db() {
+    python -c "import sys, time; from atoslib import atos_lib
+atos_lib.atos_db.db('DB'); open('held', 'w').close(); time.sleep(60)" &
+    while [ ! -f held ]; do sleep 0.1; done
+    rm held
+}
+hold_db
+if $ROOT/bin/atos lib compact -C DB -t json; then false; fi
+[ -f DB/results.sqlite -a ! -f DB/results.json ]
+$ROOT/bin/atos lib compact -C DB
+kill $!
+wait $! || true
+$ROOT/bin/atos lib compact -C DB -t results_db
+hold_db
+if $ROOT/bin/atos lib compact -C DB -t pickle; then false; fi
+kill $!
+wait $! || true
+[ -f DB/results.db -a ! -f DB/results.pkl ]
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 10 ]
+
+# concurrent additions are not lost
+$ROOT/bin/atos lib compact -C DB -t results_db
+for i in `seq 1 10`; do
+    $ROOT/bin/atos lib add_result -C DB \
+        -r "target:sha1-c,variant:OPT-O5,time:5$i,size:105"
+done &
+for i in `seq 1 5`; do $ROOT/bin/atos lib compact -C DB --aggregate; done
+wait
+[ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 20 ]
+
+# binary database queried while compacted
+$ROOT/bin/atos lib compact -C DB -t binary
+for i in `seq 1 5`; do $ROOT/bin/atos lib compact -C DB; done &
+for i in `seq 1 10`; do
+    [ `$ROOT/bin/atos lib query -C DB --lines | wc -l` -eq 20 ]
+done
+wait
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, json, threading
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS lib cached configuration"
+
+
+parsed = []
+json_config_init = atos_lib.json_config.__init__
+def counted_init(self, cfgpath):
+    parsed.append(cfgpath)
+    json_config_init(self, cfgpath)
+atos_lib.json_config.__init__ = counted_init
+
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+config = atos_lib.json_config(atos_config)
+config.add_value('default_values.nbruns', '3')
+config.add_compiler_entry({'basename': 'gcc', 'lto_enabled': '1'})
+del parsed[:]
+
+# configuration parsed once
+for num in range(10):
+    assert atos_lib.get_config_value(
+        atos_config, 'default_values.nbruns') == '3'
+    assert atos_lib.query_config_values(
+        atos_config, '$.compilers[*].lto_enabled') == ['1']
+assert atos_lib.get_config_value(atos_config, 'missing', 'x') == 'x'
+assert len(parsed) == 1
+
+# changes of this process are seen
+atos_lib.json_config(atos_config).add_value('default_values.nbruns', '5')
+assert atos_lib.get_config_value(
+    atos_config, 'default_values.nbruns') == '5'
+
+# changes of other processes are seen
+with open(os.path.join(atos_config, 'config.json'), 'w') as outf:
+    json.dump({'default_values': {'nbruns': '12'}}, outf)
+assert atos_lib.get_config_value(
+    atos_config, 'default_values.nbruns') == '12'
+assert atos_lib.query_config_values(
+    atos_config, '$.compilers[*].lto_enabled') is None
+
+# shared by threads
+del parsed[:]
+values = []
+def get_values():
+    for num in range(100):
+        values.append(atos_lib.get_config_value(
+                atos_config, 'default_values.nbruns'))
+threads = [threading.Thread(target=get_values) for num in range(4)]
+map(lambda x: x.start(), threads)
+map(lambda x: x.join(), threads)
+assert values == ['12'] * 400
+assert len(parsed) <= 1
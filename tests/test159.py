@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import argparse
+
+from atoslib import utils, arguments
+
+TEST_CASE = "ATOS tool arguments from cached parser actions"
+
+
+args = argparse.Namespace(configuration_path='atos-config', nbruns=5)
+
+# same arguments as from a new parser
+for tool in ['atos-build', 'atos-run', 'atos-opt', 'atos-explore']:
+    expected = {}
+    for action in arguments.parser(tool)._actions:
+        expected[action.dest] = action.default
+    expected.update(vars(args))
+    expected.update({'variant': 'OPT-O2'})
+    for num in range(3):
+        tool_args = utils.atos_tool_args(tool, args, variant='OPT-O2')
+        assert vars(tool_args) == expected
+
+# parser built once per tool
+built = []
+parser = arguments.parser
+arguments.parser = lambda tool: built.append(tool) or parser(tool)
+for num in range(10):
+    utils.atos_tool_args('atos-run', args, nbruns=num)
+    cmdline = utils.atos_tool_cmdline('atos-run', args, nbruns=num)
+    assert cmdline[1] == 'run'
+assert built == []
+utils.atos_tool_args('atos-deps', args)
+utils.atos_tool_args('atos-deps', args)
+assert built == ['atos-deps']
+
+# cached defaults are not modified through returned arguments
+tool_args = utils.atos_tool_args('atos-run', args)
+tool_args.nbruns = 12
+tool_args.__dict__['results_script'] = 'x'
+defaults = utils.atos_tool_args('atos-run', argparse.Namespace())
+assert defaults.nbruns == parser('atos-run').get_default('nbruns')
+assert defaults.results_script != 'x'
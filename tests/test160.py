@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, time, threading, argparse
+
+from atoslib import multiprocess, atos_lib
+from atoslib.multiprocess import job, scheduler
+
+TEST_CASE = "ATOS parallel jobs scheduler"
+
+
+def start_all(sched, jobs, started):
+    # start each job in its own thread, record start order
+    def start(new_job):
+        sched.start(new_job)
+        started.append(new_job)
+    threads = map(lambda x: threading.Thread(target=start, args=(x,)), jobs)
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    return threads
+
+# ready jobs are started in priority then expected time order
+sched = scheduler({'build': 1, 'run': 2})
+first = job('build')
+assert sched.start(first) == 0
+started = []
+jobs = [job('build', priority=1, expected=5), job('build', priority=1),
+        job('build', priority=0, expected=10),
+        job('build', priority=1, expected=2)]
+threads = start_all(sched, jobs, started)
+assert started == []
+for num in range(len(jobs)):
+    sched.end(started and started[-1] or first)
+    while len(started) < num + 1: time.sleep(0.01)
+    assert started[-1].slot == 0
+map(lambda x: x.join(), threads)
+assert started == [jobs[2], jobs[1], jobs[3], jobs[0]]
+
+# slots of each kind are independent
+run_jobs = [job('run'), job('run')]
+assert sorted(map(sched.start, run_jobs)) == [0, 1]
+sched.end(run_jobs[1])
+run_jobs[1] = job('run')
+assert sched.start(run_jobs[1]) == 1
+map(sched.end, run_jobs)
+
+# jobs start after their dependencies
+started = []
+dep = job('run')
+jobs = [job('run', deps=[dep])]
+threads = start_all(sched, jobs, started)
+assert started == []
+sched.start(dep)
+time.sleep(0.1)
+assert started == []
+sched.end(dep)
+map(lambda x: x.join(), threads)
+assert started == jobs
+sched.end(jobs[0])
+sched.wait([dep] + jobs)
+
+# parallel builds use at most build_jobs distinct slots
+atos_config = 'atos-config'
+os.mkdir(atos_config)
+multiprocess.setup({'build_jobs': 3, 'run_jobs': 1,
+                    'configuration_path': atos_config})
+assert multiprocess.enabled()
+running, slots, lock = [0], [], threading.Lock()
+def run_atos_build(args):
+    with lock:
+        running[0] += 1
+        assert running[0] <= 3
+        assert args.build_slot not in slots
+        slots.append(args.build_slot)
+    time.sleep(0.05)
+    with lock:
+        running[0] -= 1
+        slots.remove(args.build_slot)
+    return 0
+threads = map(lambda x: threading.Thread(
+        target=multiprocess.launch, args=(
+            run_atos_build, argparse.Namespace(gopts=None, uopts=None))),
+              range(12))
+map(lambda x: x.start(), threads)
+map(lambda x: x.join(), threads)
+assert running == [0] and slots == []
+
+# atos_opt jobs of the same config are serialized
+events = []
+def run_atos_opt(args):
+    events.append(('start', args.options))
+    time.sleep(0.1)
+    events.append(('end', args.options))
+    return 0
+for options in ['-O2', '-O3', '-O2']:
+    multiprocess.launch(run_atos_opt, argparse.Namespace(
+            configuration_path=atos_config, options=options, uopts=None,
+            fdo=False, lto=False, cookies=['c' + options], profile=False,
+            nbruns=1))
+multiprocess.wait_for_results(['c-O2', 'c-O3'])
+assert len(events) == 6
+assert events.index(('end', '-O2')) < max(
+    filter(lambda x: events[x] == ('start', '-O2'), range(6)))
+assert events.index(('start', '-O3')) < events.index(('end', '-O2'))
+
+# finished jobs are not kept in the jobs registry
+assert multiprocess.mp.cookie_jobs == {}
+assert multiprocess.mp.job_runs == {}
+assert multiprocess.mp.cfg_job_map == {}
+
+# wait on cookies of still running jobs only
+release = threading.Event()
+def run_atos_opt(args):
+    release.wait()
+    return 0
+multiprocess.launch(run_atos_opt, argparse.Namespace(
+        configuration_path=atos_config, options='-Os', uopts=None,
+        fdo=False, lto=False, cookies=['c1', 'c2'], profile=False, nbruns=1))
+assert multiprocess.mp.cookie_jobs == {'c1': 1, 'c2': 1}
+start = time.time()
+multiprocess.wait_for_results(['c-O2', 'c-O3', 'c3'])
+assert time.time() - start < 1
+threading.Timer(0.2, release.set).start()
+multiprocess.wait_for_results(['c0', 'c2'])
+assert release.is_set()
+assert multiprocess.mp.cookie_jobs == {}
+
+# builds ordered by fdo chain first then by recorded variant durations
+for (options, elapsed) in [('-O1', 5.0), ('-O2', 1.0), ('-O3', 3.0)]:
+    multiprocess.mp.record_time(
+        'build', atos_lib.variant_id(options), elapsed)
+held = [job('build') for num in range(3)]
+map(multiprocess.mp.scheduler.start, held)
+order = []
+def run_atos_build(args):
+    order.append(args.uopts and 'fdo' or args.options)
+    return 0
+threads = []
+for (options, uopts) in [('-O1', None), ('-O2', None), ('-O3', None),
+                         ('-O1', '-O1')]:
+    build_args = argparse.Namespace(options=options, uopts=uopts, gopts=None)
+    threads.append(threading.Thread(
+            target=multiprocess.launch, args=(run_atos_build, build_args)))
+    threads[-1].start()
+    time.sleep(0.05)
+assert order == []
+# one slot available, jobs started one after the other
+multiprocess.mp.scheduler.end(held[0])
+map(lambda x: x.join(), threads)
+map(multiprocess.mp.scheduler.end, held[1:])
+assert order == ['fdo', '-O2', '-O3', '-O1']
+
+# slots are released and jobs marked failed even on exceptions
+def run_atos_build(args):
+    raise KeyboardInterrupt
+try:
+    multiprocess.launch(run_atos_build, argparse.Namespace(
+            options='-O2', uopts=None, gopts=None))
+    assert False
+except KeyboardInterrupt:
+    pass
+assert multiprocess.mp.scheduler.slots['build'] == [True] * 3
+events = []
+def run_atos_opt(args):
+    events.append(args.options)
+    return 0
+def raise_error(): raise KeyboardInterrupt
+for (options, callbacks) in [('-Og', [raise_error]), ('-Og', [])]:
+    multiprocess.launch(run_atos_opt, argparse.Namespace(
+            configuration_path=atos_config, options=options, uopts=None,
+            fdo=False, lto=False, cookies=['c' + options], profile=False,
+            nbruns=1, opt_callbacks=callbacks))
+multiprocess.wait_for_results(['c-Og'])
+assert events == ['-Og', '-Og']
+assert multiprocess.mp.cfg_job_map == {}
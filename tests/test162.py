@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, argparse
+
+from atoslib import multiprocess, atos_lib, process, logger
+from atoslib.multiprocess import cpu_list, cpu_layout, allowed_cpus
+
+TEST_CASE = "ATOS cpu affinity of parallel run slots"
+
+
+assert cpu_list("") == []
+assert cpu_list("3,0-2,6-7,2") == [0, 1, 2, 3, 6, 7]
+
+# no affinity by default
+assert cpu_layout("", "", 4, cpus=range(8)) == (None, None)
+assert cpu_layout(None, None, 4, cpus=range(8)) == (None, None)
+
+# one dedicated cpu per run slot, builds on remaining cpus
+assert cpu_layout("auto", "", 3, cpus=range(8)) == (["7", "6", "5"], "0,1,2,3,4")
+assert cpu_layout("auto", "", 8, cpus=range(8)) == (None, None)
+
+# only the cpus allowed for the process are used
+assert cpu_layout("auto", "", 2, cpus=[2, 3, 5, 9]) == (["9", "5"], "2,3")
+assert cpu_layout("0", "", 1, cpus=[2, 3, 5]) == (["0"], "2,3,5")
+allowed = open('/proc/self/status').read().split(
+    'Cpus_allowed_list:')[1].split('\n')[0].strip()
+assert allowed_cpus() == cpu_list(allowed)
+
+# explicit layouts
+assert cpu_layout("2-3:4-5", "", 2, cpus=range(8)) == (
+    ["2,3", "4,5"], "0,1,6,7")
+assert cpu_layout("2-3:4-5", "0", 1, cpus=range(8)) == (["2,3", "4,5"], "0")
+assert cpu_layout("", "0-1", 2, cpus=range(8)) == (None, "0,1")
+
+# invalid layouts (sys.exit is overridden in tests)
+class LayoutError(Exception): pass
+def error(msg, exit_status=None): raise LayoutError(msg)
+logger.error = error
+for layout in [("2-3:3-4", ""), ("2-3", ""), ("a-b", ""), ("0-3:4-7", "")]:
+    try:
+        cpu_layout(layout[0], layout[1], 2, cpus=range(8))
+        assert 0
+    except LayoutError:
+        pass
+
+# layout from config, applied to run slots
+os.environ["ATOS_PARALLEL"] = "2"
+atos_config = "atos-config"
+process.commands.mkdir(atos_config)
+atos_lib.json_config(os.path.join(atos_config, 'config.json')).add_value(
+    "default_values.run_cpus", "0:0")
+try:
+    multiprocess.setup({'configuration_path': atos_config})
+    assert 0
+except LayoutError:
+    pass
+atos_lib.json_config(os.path.join(atos_config, 'config.json')).add_value(
+    "default_values.run_cpus", "0:1")
+atos_lib.json_config(os.path.join(atos_config, 'config.json')).add_value(
+    "default_values.build_cpus", "0")
+multiprocess.setup({'configuration_path': atos_config})
+assert multiprocess.mp.run_cpus == ["0", "1"]
+assert multiprocess.mp.build_cpus == "0"
+
+slots = []
+def run_atos_build(args):
+    slots.append(args.build_cpus)
+    return 0
+multiprocess.launch(run_atos_build, argparse.Namespace())
+assert slots == ["0"]
+
+# run process tree bound to the given cpus
+assert atos_lib.affinity_command(None) == []
+status, output = process.system(
+    atos_lib.affinity_command("0") + ["sh", "-c", "taskset -p $$"],
+    get_output=True)
+assert status == 0 and output.strip().endswith(": 1")
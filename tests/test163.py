@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+import os, stat
+
+from atoslib import process
+
+TEST_CASE = "ATOS clone of relocated build directories"
+
+
+# build dir with writable and read-only files, links and subdirs
+process.commands.mkdir("build/sub/ro")
+with open("build/exe", "w") as f: f.write("x" * 100000)
+os.chmod("build/exe", 0755)
+with open("build/sub/data", "w") as f: f.write("data")
+os.chmod("build/sub/data", 0444)
+with open("build/sub/out", "w") as f: f.write("out")
+with open("build/sub/ro/file", "w") as f: f.write("ro")
+os.symlink("sub", "build/link")
+os.symlink("exe", "build/sub/../exe.link")
+os.chmod("build/sub/ro", 0555)
+
+def tree(root):
+    content = {}
+    for path, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            full = os.path.join(path, name)
+            mode = os.lstat(full).st_mode
+            data = (
+                os.readlink(full) if stat.S_ISLNK(mode) else
+                stat.S_ISDIR(mode) and 'dir' or open(full).read())
+            content[os.path.relpath(full, root)] = (stat.S_IMODE(mode), data)
+    return content
+
+size = 100000 + 4 + 3 + 2
+for strategy in ['copy', 'reflink', 'link']:
+    dest = "run-" + strategy
+    copied = process.commands.clonetree("build", dest, strategy)
+    assert tree(dest) == tree("build")
+    assert os.path.islink(os.path.join(dest, "link"))
+    linked = (os.stat(os.path.join(dest, "sub/data")).st_ino ==
+              os.stat("build/sub/data").st_ino)
+    assert linked == (strategy == 'link')
+    if strategy == 'copy': assert copied == size
+    if strategy == 'reflink': assert copied in [0, size]
+    if strategy == 'link': assert copied in [0, size - 4]
+    # clone is independent from the build dir
+    with open(os.path.join(dest, "sub/out"), "w") as f: f.write("new")
+    assert open("build/sub/out").read() == "out"
+    os.chmod(os.path.join(dest, "sub/ro"), 0755)
+    process.commands.rmtree(dest)
+    assert tree("build")["sub/data"] == (0444, "data")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+#
+#
+
+import common
+
+from atoslib import atos_lib
+
+TEST_CASE = "ATOS graph live frontier"
+
+try:
+    import pylab, matplotlib
+except ImportError:
+    common.skip("pylab matplotlib module not available")
+
+from atoslib import atos_graph
+
+
+def reference_frontier(results):
+    # a result is dominated by a different result of lower size and time
+    return map(lambda c1: not any(map(lambda c2: (
+                    (c2.time, c2.size) != (c1.time, c1.size) and
+                    c2.time <= c1.time and c2.size <= c1.size), results)),
+               results)
+
+def live_results(points):
+    return map(lambda (variant, time, size):
+                   atos_lib.atos_client_results.result(
+            {'variant': variant, 'target': 'sha1-c', 'time': time,
+             'size': size}), points)
+
+# new variants dominating already known ones
+atos_graph.update_live_frontier('db', live_results([('A', 10.0, 10)]))
+for points in [[('A', 10.0, 10), ('B', 5.0, 5)],
+               [('A', 10.0, 10), ('B', 5.0, 5), ('C', 1.0, 1)],
+               [('A', 10.0, 10), ('C', 1.0, 1), ('B', 5.0, 5)],
+               [('A', 10.0, 10), ('B', 5.0, 5), ('C', 1.0, 1),
+                ('D', 0.5, 20)]]:
+    results = live_results(points)
+    atos_graph.update_live_frontier('db', results)
+    assert map(lambda x: x.on_frontier, results) == (
+        reference_frontier(results))